@@ -0,0 +1,117 @@
+"""ASGI entry point: the Flask app behind a2wsgi, with /api/stream served on the event loop.
+
+    pip install uvicorn a2wsgi
+    python serve.py --mode asgi            # or, one process: uvicorn asgi:application
+
+Ordinary requests run the Flask app in a pool of THREADS threads, just as
+under a threaded WSGI server. (asgiref's WsgiToAsgi would put them all on
+one thread.) The live-update stream is the exception:
+its clients spend nearly all their time waiting, so here they wait as
+coroutines and any number of open EventSource connections or long polls
+cost no threads. Mail notifications already go out from their own
+background thread in either mode.
+"""
+import asyncio
+import json
+import os
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import main
+from event_hub import AsyncWaiter, format_sse
+
+app = main.create_app()
+services = main.get_services(app)
+flask_app = WSGIMiddleware(app, workers=int(os.environ.get('THREADS', 8)))
+_waiters = {} #event loop -> AsyncWaiter
+
+
+def _waiter() -> AsyncWaiter:
+    loop = asyncio.get_running_loop()
+    waiter = _waiters.get(loop)
+    if waiter is None:
+        for closed in [other for other in _waiters if other.is_closed()]:
+            _waiters.pop(closed).close()
+        waiter = _waiters[loop] = AsyncWaiter(services.event_hub, loop)
+    return waiter
+
+
+async def _send_json(send, status: int, data) -> None:
+    body = json.dumps(data).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+        (b'cache-control', b'no-cache')
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream(scope, receive, send) -> None:
+    """Same protocol as main.api_stream"""
+    args = {key: values[-1] for key, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+    headers = dict(scope['headers'])
+    last_id = headers.get(b'last-event-id', b'').decode('latin-1') or args.get('last_id')
+    after, reset = main.stream_cursor(services.event_hub, last_id)
+    waiter = _waiter()
+
+    if args.get('poll'):
+        try:
+            timeout = main.poll_timeout(args.get('timeout'))
+        except ValueError as e:
+            await _send_json(send, 400, {'status': 'error', 'message': str(e)})
+            return
+        events, lost = await waiter.wait(after, timeout)
+        await _send_json(send, 200, main.poll_response_data(services.event_hub, events, lost, after, reset))
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no')
+    ]})
+
+    async def send_chunk(text: str) -> None:
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+    async def pump():
+        if reset:
+            await send_chunk(format_sse(services.event_hub.event_id(after), 'reset', {}))
+        async for chunk in waiter.stream(after):
+            await send_chunk(chunk)
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    #stop streaming as soon as the client goes away, not at the next heartbeat
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        if task.exception() and not isinstance(task.exception(), OSError):
+            raise task.exception()
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            loop = asyncio.get_running_loop()
+            waiter = _waiters.pop(loop, None)
+            if waiter is not None:
+                waiter.close()
+            #write out buffered log rows and queued notification mails before the worker exits
+            await loop.run_in_executor(None, services.close)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send) -> None:
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/stream' and scope['method'] == 'GET':
+        await stream(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
@@ -0,0 +1,76 @@
+"""Compare two saved benchmark runs and fail on regressions.
+
+    python benchmarks/micro.py --output before.json
+    ... change things ...
+    python benchmarks/micro.py --output after.json
+    python benchmarks/compare.py before.json after.json --threshold 10
+
+Results are matched by name (and mode for load runs). Exits with status 1
+when any tracked metric got worse by more than --threshold percent, and
+with status 2 when the runs used different settings (rows, concurrency,
+mode, ...) or have no result in common.
+"""
+import argparse
+import json
+import sys
+
+# suite -> [(metric, True when higher is better)]
+METRICS = {
+    'micro': [('best_us', False)], #the least noisy of the repeats,
+    'load': [('p50_ms', False), ('p95_ms', False), ('rps', True)],
+    'serving': [('p50_ms', False), ('p95_ms', False), ('rps', True)],
+}
+#settings that change what is measured, runs must agree on them
+SETTINGS = ('rows', 'concurrency', 'mode', 'workers', 'threads', 'streams', 'cold')
+
+
+def load(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(before: dict, after: dict, threshold: float):
+    """Rows of (name, metric, before, after, change %, regressed)"""
+    if before['suite'] != after['suite']:
+        raise ValueError(f"Cannot compare a {before['suite']} run with a {after['suite']} run")
+    old_settings, new_settings = before.get('settings', {}), after.get('settings', {})
+    differing = [name for name in SETTINGS if old_settings.get(name) != new_settings.get(name)]
+    if differing:
+        raise ValueError('Runs used different settings: ' + ', '.join(
+            f'{name} {old_settings.get(name)} -> {new_settings.get(name)}' for name in differing))
+    key = lambda result: (result['name'], result.get('mode'))
+    old = {key(result): result for result in before['results']}
+    matched = [(old[key(result)], result) for result in after['results'] if key(result) in old]
+    if not matched:
+        raise ValueError('The runs have no result in common')
+    rows = []
+    for previous, result in matched:
+        if previous.get('rows') != result.get('rows'):
+            raise ValueError(f"{result['name']} ran on {previous.get('rows')} rows before and {result.get('rows')} after")
+        for metric, higher_is_better in METRICS.get(after['suite'], []):
+            if not previous.get(metric):
+                continue
+            change = (result[metric] - previous[metric]) / previous[metric] * 100
+            worse = -change if higher_is_better else change
+            rows.append((result['name'], metric, previous[metric], result[metric], round(change, 1), worse > threshold))
+    return rows
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed slowdown in percent')
+    args = parser.parse_args()
+
+    try:
+        rows = compare(load(args.before), load(args.after), args.threshold)
+    except ValueError as e:
+        parser.error(str(e))
+    for name, metric, old, new, change, regressed in rows:
+        print(f"{'REGRESSION' if regressed else 'ok':<10}  {name:<32} {metric:<10} {old:>12} -> {new:<12} {change:+.1f}%")
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
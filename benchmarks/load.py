@@ -0,0 +1,175 @@
+"""Load test of the main routes, through the Flask test client or a local WSGI server.
+
+    python benchmarks/load.py                                   # test client, 10k entries of each kind
+    python benchmarks/load.py --server --concurrency 8 --rows 100000
+    python benchmarks/load.py --cold --output load.json         # response cache off, results saved
+
+The test client measures the app alone; --server puts werkzeug's
+threaded WSGI server and real HTTP in between. Every request comes from
+a different client address, so the feedback rate limit does not turn
+the submit scenario into a 429 benchmark. Latencies are wall clock per
+request, percentiles over all requests of a scenario.
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report import emit, percentile
+
+# name -> (method, path), POST bodies come from submit_form()
+SCENARIOS = {
+    'submit': ('POST', '/feedback/submit'),
+    'admin_filtered': ('GET', '/feedback/admin?status=new&type=bug&priority=high'),
+    'admin_search': ('GET', '/feedback/admin?q=login+slow'),
+    'feedback_stats': ('GET', '/api/feedback/stats'),
+    'guestbook_api': ('GET', '/api/guestbook?limit=20'),
+    'feedback_api': ('GET', '/api/feedback?limit=50'),
+}
+
+
+def submit_form(i: int) -> dict:
+    return {
+        'name': f'Bench {i}', 'email': f'bench{i}@example.com', 'subject': f'Benchmark {i}',
+        'message': ['The search is slow when I filter', 'Love the new design, great work',
+                    'Login page is broken on mobile'][i % 3] + f' (run {i})',
+        'type': ['bug', 'praise', 'bug'][i % 3]
+    }
+
+
+def client_address(n: int) -> str:
+    return f'10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}'
+
+
+def test_client_sender(app):
+    local = threading.local()
+
+    def send(method, path, form, address):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.open(path, method=method, data=form, environ_base={'REMOTE_ADDR': address})
+        response.get_data()
+        return response.status_code
+
+    return send
+
+
+def server_sender(port: int):
+    local = threading.local()
+
+    def send(method, path, form, address):
+        if not hasattr(local, 'conn'):
+            local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        headers = {'X-Forwarded-For': address} #the server runs with TRUSTED_PROXIES=1
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        local.conn.request(method, path, body=body, headers=headers)
+        response = local.conn.getresponse()
+        response.read()
+        return response.status
+
+    return send
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_scenario(send, name: str, requests: int, concurrency: int, warmup: int, offset: int) -> dict:
+    method, path = SCENARIOS[name]
+    latencies, errors = [], []
+
+    def worker(start: int, count: int, record: bool):
+        for i in range(start, start + count):
+            form = submit_form(i) if method == 'POST' else None
+            began = time.perf_counter()
+            try:
+                status = send(method, path, form, client_address(i))
+            except (OSError, http.client.HTTPException):
+                status = 599 #timed out or refused, e.g. every server thread busy
+            elapsed = time.perf_counter() - began
+            if record:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors.append(status)
+
+    worker(offset, warmup, False)
+    offset += warmup
+    share = requests // concurrency
+    threads = [
+        threading.Thread(target=worker, args=(offset + n * share, share + (requests % concurrency if n == 0 else 0), True))
+        for n in range(concurrency)
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - began
+
+    latencies.sort()
+    return {
+        'name': name,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / wall, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help='guestbook entries and feedback to generate')
+    parser.add_argument('--requests', type=int, default=1000, help='per scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads')
+    parser.add_argument('--warmup', type=int, default=20, help='unrecorded requests per scenario')
+    parser.add_argument('--server', action='store_true', help='go through a local WSGI server over HTTP')
+    parser.add_argument('--cold', action='store_true', help='disable the response cache')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated subset')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    parser.add_argument('--output', help='also write the JSON to this file')
+    args = parser.parse_args()
+
+    from main import create_app, get_services
+    from synthetic import populate
+    #client addresses come from X-Forwarded-For, see the senders
+    config = {'TRUSTED_PROXIES': 1}
+    if args.cold:
+        config['RESPONSE_CACHE_SIZE'] = 0
+    app = create_app(config)
+    populate(get_services(app), guestbook=args.rows, feedback=args.rows)
+
+    mode = 'server' if args.server else 'test_client'
+    send = server_sender(start_server(app).server_port) if args.server else test_client_sender(app)
+    results = []
+    offset = 0
+    with contextlib.redirect_stdout(io.StringIO()): #console notifications for every submit
+        for name in args.scenarios.split(','):
+            result = run_scenario(send, name, args.requests, args.concurrency, args.warmup, offset)
+            result['mode'] = mode
+            results.append(result)
+            offset += args.requests + args.warmup
+            print(f"{name}: {result['rps']} req/s", file=sys.stderr)
+        get_services(app).feedback_manager.notifier.close()
+
+    emit('load', results, ['name', 'mode', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'],
+         args.json, args.output, rows=args.rows, concurrency=args.concurrency, mode=mode, cold=args.cold)
+
+
+if __name__ == '__main__':
+    main_cli()
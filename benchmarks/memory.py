@@ -0,0 +1,150 @@
+"""Bytes per stored entry, old dict-backed records against the slotted ones, and of the whole app.
+
+    python benchmarks/memory.py                 # 100000 rows of each kind
+    python benchmarks/memory.py --rows 1000000 --json
+
+"before" rebuilds the original layout: a plain object with a __dict__, a
+datetime per record and its own copy of the IP and User-Agent strings (as
+every request parses them anew). "after" are the Record classes from
+main.py as loaded from storage, feedback with its sentiment label from
+get_entry_sentiment as the indexes leave it, and "columnar" is the
+history kept in a ColumnarRingBuffer. These sizes are sys.getsizeof
+summed over everything reachable from the rows, shared objects (interned
+strings) counted once and the list holding the rows included.
+
+"app" is what a running app holds per entry: everything tracemalloc sees
+allocated by filling a fresh app's collection (records, indexes, id
+order), less the empty app. Encoded JSON and rendered pages come on top
+as they are served, up to JSON_CACHE_SIZE and the response cache bounds.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from array import array
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from storage import ColumnarRingBuffer, build_record
+from synthetic import fake_rows, populate
+
+
+class LegacyRecord:
+    """The original representation, attributes in a per-instance dict"""
+
+
+def legacy(row):
+    obj = LegacyRecord()
+    obj.__dict__.update(row)
+    return obj
+
+
+def deep_size(root) -> int:
+    seen = set()
+    total = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, ColumnarRingBuffer):
+            stack.append(obj._columns)
+        elif not isinstance(obj, (str, int, float, datetime, array)) and obj is not None:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for name in cls.__dict__.get('__slots__', ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return total
+
+
+def measure(build, rows: int) -> float:
+    kept = build()
+    size = deep_size(kept)
+    del kept
+    gc.collect()
+    return size / rows
+
+
+def measure_app(kind: str, rows: int) -> float:
+    """tracemalloc bytes per entry of an app holding `rows` entries of `kind`"""
+    gc.collect()
+    tracemalloc.start()
+    app = main.create_app({'METRICS': False, 'GUESTBOOK_STORAGE': 'memory://', 'HISTORY_SIZE': max(rows, 1)})
+    services = main.get_services(app)
+    gc.collect()
+    empty = tracemalloc.get_traced_memory()[0]
+    if kind == 'history':
+        for row in fake_rows(kind, rows):
+            services.user_history.append(build_record(main.UserHistory, row))
+    else:
+        populate(services, **{kind: rows})
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - empty
+    tracemalloc.stop()
+    services.close()
+    return size / rows
+
+
+def run(rows: int):
+    classes = {'guestbook': main.GuestbookEntry, 'feedback': main.FeedbackEntry, 'history': main.UserHistory}
+    manager = main.get_services(main.create_app({'METRICS': False})).feedback_manager
+
+    def legacy_held(row):
+        #the original records had no sentiment on them, it was recomputed on every read
+        return legacy({name: value for name, value in row.items() if not name.startswith('sentiment')})
+
+    def held(record_cls, row):
+        obj = build_record(record_cls, row)
+        if 'sentiment' in row:
+            manager.get_entry_sentiment(obj)
+        return obj
+
+    results = []
+    for kind, record_cls in classes.items():
+        before = measure(lambda: [legacy_held(row) for row in fake_rows(kind, rows)], rows)
+        after = measure(lambda: [held(record_cls, row) for row in fake_rows(kind, rows)], rows)
+        result = {'kind': kind, 'rows': rows, 'before': round(before, 1), 'after': round(after, 1),
+                  'app': round(measure_app(kind, rows), 1)}
+
+        if kind == 'history':
+            def columnar():
+                buffer = ColumnarRingBuffer(rows, record_cls)
+                for row in fake_rows(kind, rows):
+                    buffer.append(build_record(record_cls, row))
+                return buffer
+            result['columnar'] = round(measure(columnar, rows), 1)
+        results.append(result)
+    return results
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    results = run(args.rows)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'bytes per entry, {args.rows} rows')
+    print(f"{'kind':<10} {'before':>8} {'after':>8} {'columnar':>9} {'app':>8}")
+    for result in results:
+        print(f"{result['kind']:<10} {result['before']:>8} {result['after']:>8} {result.get('columnar', ''):>9} "
+              f"{result['app']:>8}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,100 @@
+"""Micro-benchmarks of the feedback hot paths on synthetic data.
+
+    python benchmarks/micro.py                          # 10k feedback entries
+    python benchmarks/micro.py --rows 1000000 --only filter,search
+    python benchmarks/micro.py --output micro.json      # for benchmarks/compare.py
+
+Each benchmark is timed with timeit (auto-ranged to at least 0.2 s per
+round, best and median of --repeat rounds) and reported per call. The
+full-scan FeedbackManager methods run next to the indexes the app
+actually serves from, so both sides of every trade-off are visible.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import create_app, get_services
+from feedback_export import iter_export
+from serialization import splice
+from report import emit
+from synthetic import populate
+
+SEARCH_QUERY = 'login slow'
+
+
+def benchmarks(services):
+    """(name, function, operations per call) for every benchmark"""
+    manager = services.feedback_manager
+    entries = services.feedback_entries.snapshot()
+    search = services.feedback_search #built here, not in the first timed call
+    messages = [entry.message for entry in entries[:1000]]
+    page = entries[:50]
+    sample = entries[0]
+
+    def each(fn):
+        return lambda: [fn(message) for message in messages]
+
+    return [
+        ('analyze_feedback_sentiment', each(manager.analyze_feedback_sentiment), len(messages)),
+        ('contains_spam_indicators', each(manager.contains_spam_indicators), len(messages)),
+        ('validate_feedback', lambda: manager.validate_feedback(
+            sample.name, sample.email, sample.subject, sample.message, sample.feedback_type), 1),
+        ('filter_feedback (scan)', lambda: manager.filter_feedback(entries, 'new', 'bug'), 1),
+        ('filter_feedback (index)', lambda: services.feedback_filters.filter('new', 'bug'), 1),
+        ('search_feedback (scan)', lambda: manager.search_feedback(entries, SEARCH_QUERY), 1),
+        ('search_feedback (index)', lambda: search.search(SEARCH_QUERY), 1),
+        ('search_feedback (index, top 50)', lambda: search.search(SEARCH_QUERY, limit=50), 1),
+        ('get_feedback_stats (scan)', lambda: manager.get_feedback_stats(entries), 1),
+        ('get_feedback_stats (index)', services.feedback_stats.snapshot, 1),
+        ('export_feedback json', lambda: manager.export_feedback(entries, 'json'), 1),
+        ('iter_export ndjson', lambda: sum(map(len, iter_export(iter(entries), 'ndjson'))), 1),
+        ('to_dict page of 50', lambda: [entry.to_dict() for entry in page], 1),
+        ('encode page of 50 (json.dumps)', lambda: json.dumps({'feedback': [entry.to_dict() for entry in page]}), 1),
+        ('encode page of 50 (encoder)', lambda: services.encode({'feedback': [entry.to_dict() for entry in page]}), 1),
+        ('encode page of 50 (cached)', lambda: splice(
+            services.encode, {}, 'feedback', services.feedback_json.encode_all(page)), 1),
+    ]
+
+
+def run(rows: int, repeat: int, only=None):
+    services = get_services(create_app({'GUESTBOOK_STORAGE': 'memory://'}))
+    populate(services, feedback=rows)
+    results = []
+    for name, fn, ops in benchmarks(services):
+        if only and not any(word in name for word in only):
+            continue
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()
+        per_call = sorted(seconds / number / ops for seconds in timer.repeat(repeat, number))
+        results.append({
+            'name': name,
+            'rows': rows,
+            'calls': number * ops,
+            'best_us': round(per_call[0] * 1e6, 3),
+            'median_us': round(median(per_call) * 1e6, 3)
+        })
+        print(f'{name}: {results[-1]["median_us"]} us', file=sys.stderr)
+    return results
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help='feedback entries to generate')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='comma separated name fragments to run, e.g. filter,search')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    parser.add_argument('--output', help='also write the JSON to this file')
+    args = parser.parse_args()
+
+    only = args.only.split(',') if args.only else None
+    results = run(args.rows, args.repeat, only)
+    emit('micro', results, ['name', 'rows', 'best_us', 'median_us'], args.json, args.output,
+         rows=args.rows, repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main_cli()
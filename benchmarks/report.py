@@ -0,0 +1,61 @@
+"""Machine-readable benchmark results.
+
+Every suite writes {"suite", "environment", "results"} where each result
+is a flat dict with a unique "name"; compare.py diffs two such files.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'started': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+
+def emit(suite: str, results: List[Dict[str, Any]], columns: Sequence[str], as_json: bool = False,
+         output: Optional[str] = None, **settings) -> None:
+    """Print a table (or JSON) and optionally save the JSON to `output`"""
+    document = {'suite': suite, 'environment': environment(), 'settings': settings, 'results': results}
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+    if as_json:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+        return
+
+    widths = [max(len(column), *(len(_cell(result.get(column))) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(_cell(result.get(column)).ljust(width) for column, width in zip(columns, widths)))
+
+
+def _cell(value: Any) -> str:
+    if isinstance(value, float):
+        return f'{value:.3f}' if value < 1000 else f'{value:.0f}'
+    return '' if value is None else str(value)
@@ -0,0 +1,133 @@
+"""Compare the serve.py modes (gunicorn WSGI, uvicorn ASGI) under the same load.
+
+    pip install gunicorn uvicorn a2wsgi
+    python benchmarks/serving.py                              # both modes, 2 workers
+    python benchmarks/serving.py --streams 32 --concurrency 8 --output serving.json
+
+Each mode is started as a real server process on a temporary SQLite
+database filled with synthetic data. --streams keeps that many idle
+/api/stream (EventSource) clients connected during the run: under WSGI
+each of them occupies a worker thread, under ASGI none, which is where
+the two modes differ most.
+"""
+import argparse
+import contextlib
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load import run_scenario, server_sender
+from report import emit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCENARIOS = 'feedback_api,guestbook_api,feedback_stats,submit,admin_filtered'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/guestbook?limit=1')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not come up')
+
+
+def open_streams(port: int, count: int) -> list:
+    """Idle EventSource clients, each a socket reading the stream in a daemon thread"""
+    sockets = []
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b'GET /api/stream HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n')
+
+        def drain(sock=sock):
+            with contextlib.suppress(OSError):
+                while sock.recv(4096):
+                    pass
+
+        threading.Thread(target=drain, daemon=True).start()
+        sockets.append(sock)
+    return sockets
+
+
+def populate_database(path: str, rows: int) -> None:
+    from main import create_app, get_services
+    from synthetic import populate
+    services = get_services(create_app({'GUESTBOOK_STORAGE': f'sqlite:///{path}'}))
+    populate(services, guestbook=rows, feedback=rows)
+    services.store.flush()
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='per wsgi worker')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=1000, help='per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--streams', type=int, default=0, help='idle /api/stream clients held open')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS)
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    parser.add_argument('--output', help='also write the JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'bench.db')
+        populate_database(database, args.rows)
+        env = dict(os.environ, GUESTBOOK_STORAGE=f'sqlite:///{database}', TRUSTED_PROXIES='1',
+                   SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'))
+        offset = 0
+        for mode in args.modes.split(','):
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, 'serve.py'), '--mode', mode, '--host', '127.0.0.1',
+                 '--port', str(port), '--workers', str(args.workers), '--threads', str(args.threads)],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_ready(port)
+                streams = open_streams(port, args.streams)
+                for name in args.scenarios.split(','):
+                    result = run_scenario(server_sender(port), name, args.requests, args.concurrency,
+                                          args.warmup, offset)
+                    offset += args.requests + args.warmup
+                    result.update(mode=mode, streams=args.streams)
+                    results.append(result)
+                    print(f"{mode} {name}: {result['rps']} req/s, {result['errors']} errors", file=sys.stderr)
+                for sock in streams:
+                    sock.close()
+            finally:
+                server.terminate()
+                try:
+                    server.wait(10)
+                except subprocess.TimeoutExpired:
+                    server.kill() #a gthread worker waits for its streams to notice the disconnect
+                    server.wait()
+
+    emit('serving', results, ['name', 'mode', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'],
+         args.json, args.output, workers=args.workers, threads=args.threads, rows=args.rows,
+         concurrency=args.concurrency, streams=args.streams)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,62 @@
+"""Synthetic guestbook entries and feedback for the benchmarks.
+
+Rows are generated from a seeded random source, so every run (and every
+release being compared) works on the same data.
+"""
+import random
+from datetime import datetime, timedelta
+
+from storage import build_record
+
+USER_AGENTS = [
+    f'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36'
+    for v in range(100, 120)
+] + [
+    f'Mozilla/5.0 (iPhone; CPU iPhone OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148'
+    for v in range(10)
+]
+WORDS = ('great site love the design but login is slow and search broken please add dark mode thanks '
+         'nice work bug when I click submit page crashes feature request export to excel').split()
+
+
+def fake_rows(kind: str, rows: int, seed: int = 1):
+    """Attribute dicts for `rows` records of kind guestbook, feedback or history"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    for i in range(1, rows + 1):
+        row = {
+            'id': i,
+            'timestamp': start + timedelta(seconds=i * 7, microseconds=rng.randrange(1000000)),
+            'ip_address': f'10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(256)}',
+            'user_agent': rng.choice(USER_AGENTS) + ' ', #a fresh string, like a parsed header
+        }
+        if kind == 'history':
+            row.update(action=rng.choice(['PAGE_VISIT', 'PAGE_VISIT', 'PAGE_VISIT', 'NEW_ENTRY', 'FEEDBACK_SUBMITTED']),
+                       details=rng.choice(['Visited home page', 'Viewed guestbook', 'Accessed admin panel']))
+        else:
+            row.update(name=f'User {rng.randrange(5000)}',
+                       message=' '.join(rng.choices(WORDS, k=rng.randrange(5, 30))),
+                       email=f'user{rng.randrange(5000)}@example.com')
+        if kind == 'feedback':
+            row.update(subject=' '.join(rng.choices(WORDS, k=4)),
+                       feedback_type=rng.choice(['general', 'bug', 'feature']),
+                       status=rng.choice(['new', 'reviewed', 'resolved']),
+                       priority=rng.choice(['low', 'medium', 'high']),
+                       admin_notes='', sentiment=None, sentiment_version=None)
+        yield row
+
+
+def populate(services, guestbook: int = 0, feedback: int = 0, seed: int = 1, chunk: int = 10000) -> None:
+    """Fill an app's collections (main.get_services(app), indexes included) with synthetic rows,
+    in chunks of one write each"""
+    for collection, kind, rows in ((services.guestbook_entries, 'guestbook', guestbook),
+                                   (services.feedback_entries, 'feedback', feedback)):
+        record_cls = collection.record_cls
+        batch = []
+        for row, record_id in zip(fake_rows(kind, rows, seed), collection.next_ids(rows)):
+            row['id'] = record_id
+            batch.append(build_record(record_cls, row))
+            if len(batch) == chunk:
+                collection.extend(batch)
+                batch = []
+        collection.extend(batch)
@@ -0,0 +1,137 @@
+"""Import NDJSON guestbook entries or feedback, e.g. historic data or a backup.
+
+    python bulk_import.py feedback feedback.ndjson                 # straight into GUESTBOOK_STORAGE
+    python bulk_import.py guestbook entries.ndjson --url http://localhost:5000
+    python bulk_import.py feedback - --atomic < backup.ndjson
+
+One JSON object per line, with the fields of the API responses (the
+output of /api/feedback/export?format=ndjson imports as is). Rows are
+sent to /api/<kind>/bulk in batches, each validated, scored and written
+in one transaction; without --url the app is loaded in this process and
+writes to the storage in GUESTBOOK_STORAGE. With --url the server's
+BULK_IMPORT_TOKEN has to be in the environment too, and batches refused
+by its rate limit are sent again after the wait it asks for. --atomic
+sends the whole file as one batch that is imported completely or not at
+all. Rejected rows are reported by line number and make the exit status 1.
+"""
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+def read_ndjson(lines: Iterable[str], first_line: int = 1) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Parse NDJSON into (line number, object) rows and per-line errors, blank lines are skipped"""
+    rows, errors = [], []
+    for line_no, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            errors.append({'line': line_no, 'errors': [f'Invalid JSON: {e}']})
+            continue
+        if not isinstance(row, dict):
+            errors.append({'line': line_no, 'errors': ['Expected a JSON object']})
+            continue
+        rows.append((line_no, row))
+    return rows, errors
+
+
+def local_poster():
+    """Post to the app loaded in this process"""
+    storage = os.environ.get('GUESTBOOK_STORAGE', 'memory://')
+    if not storage.startswith('sqlite:///'):
+        sys.exit(f'GUESTBOOK_STORAGE is {storage}, imported rows would be lost on exit; '
+                 f'set it to e.g. sqlite:///guestbook.db or use --url')
+    import main
+    token = secrets.token_hex()
+    app = main.create_app({'GUESTBOOK_STORAGE': storage, 'BULK_IMPORT_TOKEN': token, 'BULK_RATE_LIMIT': 0})
+    client = app.test_client()
+
+    def post(path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        response = client.post(path, data=body, content_type='application/x-ndjson',
+                               headers={'User-Agent': 'bulk_import.py', 'Authorization': f'Bearer {token}'})
+        return response.status_code, response.get_json()
+
+    def close() -> None:
+        main.get_services(app).store.flush()
+
+    return post, close
+
+
+def http_poster(url: str):
+    """Post to a running server with the BULK_IMPORT_TOKEN from the environment"""
+    headers = {'Content-Type': 'application/x-ndjson', 'User-Agent': 'bulk_import.py',
+               'Authorization': f"Bearer {os.environ.get('BULK_IMPORT_TOKEN', '')}"}
+
+    def post(path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        while True:
+            request = urllib.request.Request(url.rstrip('/') + path, data=body, method='POST', headers=headers)
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status, json.load(response)
+            except urllib.error.HTTPError as e:
+                if e.code == 429 and e.headers.get('Retry-After', '').isdigit():
+                    print(f"Rate limited, waiting {e.headers['Retry-After']} seconds", file=sys.stderr)
+                    time.sleep(int(e.headers['Retry-After']))
+                    continue
+                return e.code, json.load(e)
+
+    return post, lambda: None
+
+
+def batches(lines: List[str], batch_size: int):
+    for start in range(0, len(lines), batch_size):
+        yield start, lines[start:start + batch_size]
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('kind', choices=['feedback', 'guestbook'])
+    parser.add_argument('file', help="NDJSON file, '-' for stdin")
+    parser.add_argument('--url', help='base URL of a running server instead of the local storage')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per request')
+    parser.add_argument('--atomic', action='store_true', help='import everything or nothing')
+    parser.add_argument('--json', action='store_true', help='print the combined report as JSON')
+    args = parser.parse_args()
+
+    if args.file == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.file, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+    post, close = http_poster(args.url) if args.url else local_poster()
+    path = f'/api/{args.kind}/bulk' + ('?atomic=1' if args.atomic else '')
+    report = {'received': 0, 'imported': 0, 'ids': [], 'errors': []}
+    try:
+        for offset, batch in batches(lines, (len(lines) or 1) if args.atomic else args.batch_size):
+            status, result = post(path, '\n'.join(batch).encode('utf-8'))
+            if status not in (200, 400) or 'errors' not in result:
+                print(f"Batch at line {offset + 1} failed ({status}): {result.get('message')}", file=sys.stderr)
+                return 1
+            report['received'] += result.get('received', 0)
+            report['imported'] += result['imported']
+            report['ids'] += result['ids']
+            #the server counts lines from the start of each batch
+            report['errors'] += [dict(error, line=error['line'] + offset) for error in result['errors']]
+    finally:
+        close()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        for error in report['errors']:
+            print(f"line {error['line']}: {' '.join(error['errors'])}", file=sys.stderr)
+        print(f"imported {report['imported']} {args.kind} rows, {len(report['errors'])} rejected")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,216 @@
+"""Hammer the app from many threads (and processes) and check that nothing got lost.
+
+    python concurrency_check.py --threads 16 --requests 300
+    python concurrency_check.py --processes 4 --storage sqlite:///stress.db
+
+Every worker signs and deletes guestbook entries, submits and updates
+feedback, imports old feedback and reads the lists, admin panel and stats
+at random. Afterwards the collections are compared with the history
+counters, every index with a full recompute and `since` pages with a scan, in a fresh process and, with --processes,
+in every worker once all of them are done. Exits with status 1 on any
+mismatch or server error.
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import sys
+import json
+import threading
+from datetime import datetime
+
+from main import create_app, get_services
+
+IMPORT_AGENT = 'concurrency_check import'
+IMPORT_TOKEN = 'concurrency-check'
+
+
+def load_app(storage: str):
+    return create_app({'GUESTBOOK_STORAGE': storage, 'HISTORY_SIZE': int(os.environ.get('HISTORY_SIZE', 1000)),
+                       'BULK_IMPORT_TOKEN': IMPORT_TOKEN, 'BULK_RATE_LIMIT': 0})
+
+
+def hammer(app, worker: int, requests: int, errors: list) -> None:
+    client = app.test_client()
+    services = get_services(app)
+    rng = random.Random(worker)
+    for i in range(requests):
+        environ = {'REMOTE_ADDR': f'10.{worker % 256}.{i // 256 % 256}.{i % 256}'}
+        action = rng.random()
+        if action < 0.25:
+            response = client.post('/guestbook', data={'name': f'w{worker}', 'message': f'entry {i}'},
+                                   environ_base=environ)
+        elif action < 0.35:
+            ids = [entry.id for entry in services.guestbook_entries.page(limit=20, descending=True)[0]]
+            response = client.post(f'/guestbook/delete/{rng.choice(ids) if ids else 0}', environ_base=environ)
+        elif action < 0.55:
+            response = client.post('/feedback/submit', data={
+                'name': f'w{worker}', 'email': f'w{worker}@example.com', 'subject': f'Stress {i}',
+                'message': rng.choice(['The site is great and fast', 'Login is broken and slow',
+                                       'Please add a dark mode option']),
+                'type': rng.choice(['bug', 'feature', 'general'])
+            }, environ_base=environ)
+        elif action < 0.57:
+            #older than everything live, so ids no longer grow with timestamps
+            rows = '\n'.join(json.dumps({
+                'name': f'w{worker}', 'email': f'w{worker}@example.com', 'subject': f'Imported {i}',
+                'message': 'Imported from the old site', 'user_agent': IMPORT_AGENT,
+                'timestamp': f'{rng.randint(2019, 2024)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T12:00:00'
+            }) for _ in range(rng.randint(1, 3)))
+            response = client.post('/api/feedback/bulk', data=rows, content_type='application/x-ndjson',
+                                   headers={'Authorization': f'Bearer {IMPORT_TOKEN}'}, environ_base=environ)
+        elif action < 0.7:
+            ids = [entry.id for entry in services.feedback_entries.page(limit=20, descending=True)[0]]
+            if not ids:
+                continue
+            response = client.post(f'/feedback/admin/update/{rng.choice(ids)}', data={
+                'status': rng.choice(['new', 'reviewed', 'resolved', 'closed']),
+                'priority': rng.choice(['low', 'medium', 'high', 'critical'])
+            }, environ_base=environ)
+        else:
+            path = rng.choice(['/api/guestbook', '/api/feedback?limit=50&order=desc', '/feedback/admin', '/stats',
+                               '/api/feedback/stats', '/api/feedback/trends?days=7', '/guestbook'])
+            response = client.get(path, environ_base=environ)
+
+        if response.status_code >= 500:
+            errors.append(f'{response.status_code} from worker {worker}, request {i}')
+
+
+def run_threads(app, threads: int, requests: int, offset: int = 0) -> list:
+    errors = []
+    workers = [
+        threading.Thread(target=hammer, args=(app, offset + n, requests, errors))
+        for n in range(threads)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()): #console notifications
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        get_services(app).close()
+    return errors
+
+
+def check(app) -> list:
+    """Invariants that only hold if no write was lost or half applied"""
+    services = get_services(app)
+    services.store.sync()
+    problems = []
+    counts = services.user_history.counts
+
+    #with a shared log, count distinct ids: two workers may both delete the same entry
+    log = [(op, record_id) for _, _, name, op, record_id, _ in services.store.backend.read_since(0) if name == 'guestbook']
+    if log:
+        created = {record_id for op, record_id in log if op == 'put'}
+        deleted = {record_id for op, record_id in log if op == 'delete'}
+        if len(created) != counts['NEW_ENTRY']:
+            problems.append(f"{len(created)} distinct guestbook ids for {counts['NEW_ENTRY']} new entries")
+        expected = len(created - deleted)
+    else:
+        expected = counts['NEW_ENTRY'] - counts['DELETE_ENTRY']
+    if len(services.guestbook_entries) != expected:
+        problems.append(f'guestbook has {len(services.guestbook_entries)} entries, expected {expected}')
+    entries = list(services.feedback_entries)
+    submitted = sum(1 for entry in entries if entry.user_agent != IMPORT_AGENT)
+    if submitted != counts['FEEDBACK_SUBMITTED']:
+        problems.append(f"feedback has {submitted} submitted entries, history says {counts['FEEDBACK_SUBMITTED']}")
+
+    mismatches = services.feedback_stats.verify(entries)
+    if mismatches:
+        problems.append(f'feedback stats differ from a recompute: {mismatches}')
+    #entries logged within the same second may tie, compare the sort keys and the ids
+    indexed, scanned = services.feedback_filters.filter(), services.feedback_manager.filter_feedback(entries)
+    sort_key = services.feedback_filters._sort_key
+    if ([sort_key(e)[:2] for e in indexed] != [sort_key(e)[:2] for e in scanned]
+            or {e.id for e in indexed} != {e.id for e in scanned}):
+        problems.append('filter index order differs from filter_feedback')
+    if len(services.feedback_search) != len(entries):
+        problems.append(f'search index has {len(services.feedback_search)} entries, expected {len(entries)}')
+    trends = services.feedback_trends.snapshot(1).get('total_feedback', 0)
+    if trends != submitted:
+        problems.append(f'trends count {trends} feedback entries of the last day, expected {submitted}')
+    for name, collection in (('guestbook_json', services.guestbook_entries), ('feedback_json', services.feedback_entries)):
+        encoded = getattr(services, name)
+        items = list(collection)
+        stale = [item.id for item, fragment in zip(items, encoded.encode_all(items))
+                 if fragment != encoded.encode(item.to_dict())]
+        if stale:
+            problems.append(f'{name} has stale JSON for ids {stale[:10]}')
+    for name in ('guestbook_entries', 'feedback_entries', 'user_history'):
+        problems.extend(f'{name}: {problem}' for problem in check_since(getattr(services, name)))
+    return problems
+
+
+def check_since(collection) -> list:
+    """Pages with `since` against a filter over every record"""
+    items = sorted(collection, key=lambda item: item.id) #snapshots keep insertion order, pages go by id
+    problems = []
+    for since in [datetime(1, 1, 1), datetime(2022, 1, 1)] + [item.timestamp for item in items[::max(1, len(items) // 5)]]:
+        expected = [item.id for item in items if item.timestamp > since]
+        if [item.id for item in collection.page(since=since)[0]] != expected:
+            problems.append(f'since={since} ascending differs from a scan')
+        if [item.id for item in collection.page(since=since, descending=True)[0]] != expected[::-1]:
+            problems.append(f'since={since} descending differs from a scan')
+        paged, cursor = [], None
+        while True:
+            page, cursor = collection.page(cursor=cursor, limit=7, since=since)
+            paged.extend(item.id for item in page)
+            if cursor is None:
+                break
+        if paged != expected:
+            problems.append(f'since={since} in pages of 7 differs from a scan')
+    return problems
+
+
+def process_main(storage: str, threads: int, requests: int, offset: int, done, results) -> None:
+    app = load_app(storage)
+    errors = run_threads(app, threads, requests, offset)
+    #every worker's own view has to converge too, its syncs ran alongside its own updates
+    done.wait()
+    results.put(errors + [f'worker {offset // threads}: {problem}' for problem in check(app)])
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='per thread')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--storage', default='memory://')
+    args = parser.parse_args()
+
+    if args.processes > 1:
+        if not args.storage.startswith('sqlite:///'):
+            parser.error('--processes needs shared --storage, e.g. sqlite:///stress.db')
+        ctx = multiprocessing.get_context('spawn')
+        results, done = ctx.Queue(), ctx.Barrier(args.processes)
+        procs = [
+            ctx.Process(target=process_main,
+                        args=(args.storage, args.threads, args.requests, n * args.threads, done, results))
+            for n in range(args.processes)
+        ]
+        for proc in procs:
+            proc.start()
+        errors = [error for _ in procs for error in results.get()]
+        for proc in procs:
+            proc.join()
+        app = load_app(args.storage) #a fresh process view of everything the workers wrote
+    else:
+        app = load_app(args.storage)
+        errors = run_threads(app, args.threads, args.requests)
+
+    problems = errors + check(app)
+    services = get_services(app)
+    total = args.processes * args.threads * args.requests
+    print(f'{total} requests, {len(services.guestbook_entries)} guestbook entries, '
+          f'{len(services.feedback_entries)} feedback entries')
+    for problem in problems:
+        print(f'FAIL: {problem}')
+    if not problems:
+        print('OK')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
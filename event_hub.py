@@ -0,0 +1,233 @@
+"""Fan-out of live events to Server-Sent Events and long-poll clients.
+
+Every event is stored once in a shared ring buffer and every subscriber
+is only a cursor into it, so publishing costs the same for one or
+thousands of idle clients and nothing is copied per client. A client
+that falls more than `client_buffer` events behind skips ahead and is
+told how many it lost.
+
+Collections feed the hub through CollectionEvents, an index that turns
+inserts, changes and deletes (replayed ones from other workers included)
+into events. AsyncWaiter lets clients on an asyncio event loop (the ASGI
+mode in asgi.py) wait for events without holding a thread each.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from storage import RingBuffer
+
+# (seq, event type, data)
+Event = Tuple[int, str, Dict[str, Any]]
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    def __init__(self, history: int = 1000, client_buffer: int = 100, poll: Optional[Callable[[], None]] = None,
+                 poll_interval: float = 1.0):
+        self.client_buffer = min(client_buffer, history)
+        self.poll = poll
+        self.poll_interval = poll_interval
+        # event ids only mean something to the process that issued them
+        self.instance = uuid.uuid4().hex[:8]
+        self._events = RingBuffer(history)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._next_poll = 0.0
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> int:
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event_type, data))
+            self._cond.notify_all()
+            for listener in list(self._listeners):
+                #e.g. call_soon_threadsafe on a loop that has closed, the event is out and the write must not fail
+                try:
+                    listener()
+                except Exception as e:
+                    logger.warning("Dropping event listener %r: %s", listener, e)
+                    self._listeners.remove(listener)
+            return self._seq
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """Call `listener` on every publish, it must not block (e.g. loop.call_soon_threadsafe).
+        A listener that raises is dropped."""
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def event_id(self, seq: int) -> str:
+        return f'{self.instance}-{seq}'
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """Sequence number of an id issued by this hub, None for a foreign, stale or missing one"""
+        instance, _, seq = (event_id or '').partition('-')
+        if instance != self.instance or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        return int(seq)
+
+    def read(self, after: int) -> Tuple[List[Event], int]:
+        """Events newer than `after` (at most client_buffer of them) and the number skipped"""
+        with self._cond:
+            return self._read(after)
+
+    def _read(self, after: int) -> Tuple[List[Event], int]:
+        pending = self._seq - after
+        if pending <= 0:
+            return [], 0
+        available = min(pending, len(self._events), self.client_buffer)
+        return self._events[len(self._events) - available:], pending - available
+
+    def wait(self, after: int, timeout: float) -> Tuple[List[Event], int]:
+        """Like read(), but block up to `timeout` seconds for the first new event"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self.maybe_poll()
+            with self._cond:
+                if self._seq > after:
+                    return self._read(after)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], 0
+                self._cond.wait(min(remaining, self.poll_interval) if self.poll else remaining)
+
+    def maybe_poll(self) -> None:
+        """Let one waiting client at a time pull in writes from other workers"""
+        if self.poll is None or time.monotonic() < self._next_poll:
+            return
+        if self._poll_lock.acquire(blocking=False):
+            try:
+                self._next_poll = time.monotonic() + self.poll_interval
+                self.poll()
+            finally:
+                self._poll_lock.release()
+
+    def stream(self, after: int, heartbeat: float = 15.0) -> Iterator[str]:
+        """Server-Sent Events text, runs until the client disconnects"""
+        yield 'retry: 3000\n\n'
+        while True:
+            events, lost = self.wait(after, heartbeat)
+            if not events:
+                yield ': keepalive\n\n' #also how a closed connection is noticed
+                continue
+            if lost:
+                yield f'event: lost\ndata: {json.dumps({"count": lost})}\n\n'
+            for seq, event_type, data in events:
+                yield format_sse(self.event_id(seq), event_type, data)
+            after = events[-1][0]
+
+
+class AsyncWaiter:
+    """wait() for coroutines, all clients on one event loop share a single hub listener.
+
+    Every publish swaps in a fresh asyncio.Event and sets the old one, so
+    a coroutine that took the current event before reading the hub cannot
+    miss a publish.
+    """
+
+    def __init__(self, hub: EventHub, loop: 'asyncio.AbstractEventLoop'):
+        import asyncio #only the ASGI mode needs it, keep it out of every WSGI worker
+        self.hub = hub
+        self.loop = loop
+        self._changed = asyncio.Event()
+        self._listener = lambda: loop.call_soon_threadsafe(self._fire)
+        hub.add_listener(self._listener)
+
+    def close(self) -> None:
+        """Stop listening to the hub, for when the loop shuts down"""
+        self.hub.remove_listener(self._listener)
+
+    def _fire(self) -> None:
+        import asyncio
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self, after: int, timeout: float) -> Tuple[List[Event], int]:
+        import asyncio
+        deadline = self.loop.time() + timeout
+        while True:
+            if self.hub.poll is not None:
+                #store.sync does blocking I/O, keep it off the loop
+                await self.loop.run_in_executor(None, self.hub.maybe_poll)
+            changed = self._changed
+            events, lost = self.hub.read(after)
+            remaining = deadline - self.loop.time()
+            if events or remaining <= 0:
+                return events, lost
+            if self.hub.poll is not None:
+                remaining = min(remaining, self.hub.poll_interval)
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stream(self, after: int, heartbeat: float = 15.0):
+        """Async version of EventHub.stream()"""
+        yield 'retry: 3000\n\n'
+        while True:
+            events, lost = await self.wait(after, heartbeat)
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            if lost:
+                yield f'event: lost\ndata: {json.dumps({"count": lost})}\n\n'
+            for seq, event_type, data in events:
+                yield format_sse(self.hub.event_id(seq), event_type, data)
+            after = events[-1][0]
+
+
+def format_sse(event_id: str, event_type: str, data: Dict[str, Any]) -> str:
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+class CollectionEvents:
+    """Collection index that publishes `<name>_created`, `<name>_updated` and `<name>_deleted` events.
+
+    Only changes to the `watch` fields count as updates, e.g. the status
+    and priority of feedback.
+    """
+
+    def __init__(self, hub: EventHub, name: str, watch: Tuple[str, ...] = ()):
+        self.hub = hub
+        self.name = name
+        self.watch = watch
+        self._seen: Dict[int, Tuple] = {} #id -> watched values as last published
+        self._values: Dict[Tuple, Tuple] = {} #one shared tuple per combination, the watch fields take few values
+        self._loading = True
+
+    def update(self, item) -> None:
+        values = tuple(getattr(item, field) for field in self.watch)
+        values = self._values.setdefault(values, values)
+        old = self._seen.get(item.id)
+        self._seen[item.id] = values
+        if self._loading or old == values:
+            return
+        if old is None:
+            self.hub.publish(f'{self.name}_created', item.to_dict())
+        else:
+            changes = {'id': item.id}
+            changes.update(zip(self.watch, values))
+            self.hub.publish(f'{self.name}_updated', changes)
+
+    def remove(self, item) -> None:
+        self._seen.pop(item.id, None)
+        if not self._loading:
+            self.hub.publish(f'{self.name}_deleted', {'id': item.id})
+
+    def start(self) -> None:
+        """Begin publishing, records loaded before this are not news"""
+        self._loading = False
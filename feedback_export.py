@@ -0,0 +1,158 @@
+"""Streaming feedback export.
+
+Every writer is a generator that takes entries from any iterable and
+yields the output in chunks, so an export holds one chunk in memory no
+matter how many entries there are.
+
+    json     one JSON array
+    ndjson   one JSON object per line
+    csv      spreadsheet friendly subset of the fields, quoted by the csv module
+    parquet  columnar file for analytics, needs pyarrow
+"""
+import csv
+import json
+import zlib
+from typing import Any, Iterable, Iterator, List
+
+CHUNK_ROWS = 500
+
+CSV_HEADER = ['ID', 'Name', 'Email', 'Type', 'Subject', 'Status', 'Priority', 'Timestamp']
+
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class _ChunkBuffer:
+    """Write target that hands back whatever was written since the last take()"""
+
+    def __init__(self):
+        self._parts: List[Any] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._parts.append(data)
+        return len(data)
+
+    def take(self):
+        data = self._parts[0][:0].join(self._parts) if self._parts else ''
+        self._parts = []
+        return data
+
+    # enough of the file API for pyarrow
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return False
+
+    def seekable(self) -> bool:
+        return False
+
+
+def _chunked(entries: Iterable, size: int = CHUNK_ROWS) -> Iterator[List]:
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_json(entries: Iterable) -> Iterator[str]:
+    yield '['
+    separator = ''
+    for chunk in _chunked(entries):
+        yield separator + ','.join(json.dumps(entry.to_dict(), default=str) for entry in chunk)
+        separator = ','
+    yield ']'
+
+
+def iter_ndjson(entries: Iterable) -> Iterator[str]:
+    for chunk in _chunked(entries):
+        yield ''.join(json.dumps(entry.to_dict(), default=str) + '\n' for entry in chunk)
+
+
+def iter_csv(entries: Iterable) -> Iterator[str]:
+    buffer = _ChunkBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield buffer.take()
+    for chunk in _chunked(entries):
+        writer.writerows(
+            [entry.id, entry.name, entry.email, entry.feedback_type, entry.subject,
+             entry.status, entry.priority, entry.timestamp.isoformat()]
+            for entry in chunk
+        )
+        yield buffer.take()
+
+
+def iter_parquet(entries: Iterable, row_group_rows: int = 10000) -> Iterator[bytes]:
+    """One row group per `row_group_rows` entries, each yielded as soon as it is written"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("The parquet export needs pyarrow, pip install pyarrow")
+
+    schema = pa.schema([
+        ('id', pa.int64()), ('name', pa.string()), ('email', pa.string()), ('subject', pa.string()),
+        ('message', pa.string()), ('feedback_type', pa.string()), ('timestamp', pa.timestamp('us')),
+        ('status', pa.string()), ('priority', pa.string()), ('ip_address', pa.string()),
+        ('user_agent', pa.string()), ('admin_notes', pa.string()),
+    ])
+
+    def generate():
+        buffer = _ChunkBuffer()
+        with pq.ParquetWriter(pa.PythonFile(buffer, mode='w'), schema, compression='snappy') as writer:
+            for chunk in _chunked(entries, row_group_rows):
+                columns = {name: [getattr(entry, name) for entry in chunk] for name in schema.names}
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                data = buffer.take()
+                if data:
+                    yield data
+        data = buffer.take() #footer
+        if data:
+            yield data
+
+    return generate()
+
+
+WRITERS = {
+    'json': iter_json,
+    'ndjson': iter_ndjson,
+    'csv': iter_csv,
+    'parquet': iter_parquet,
+}
+
+
+def iter_export(entries: Iterable, format: str = 'json') -> Iterator:
+    """Chunks of the export, str for the text formats and bytes for parquet.
+
+    Raises ValueError right away (not on the first chunk) for an unknown
+    format or a missing optional dependency.
+    """
+    if format not in WRITERS:
+        raise ValueError(f"Unsupported format: {format}")
+    return WRITERS[format](entries)
+
+
+def gzip_chunks(chunks: Iterable) -> Iterator[bytes]:
+    """Compress a stream of chunks into a gzip stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) #31 = gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,17 +1,28 @@
 #!/usr/bin/env python
 import re
-import time
 from datetime import datetime, timedelta 
 from collections import defaultdict, Counter 
+from bisect import bisect_left, bisect_right, insort
+from array import array
 from typing import Dict, List, Any, Tuple, Optional 
-import smtplib
-from email.mime.text import MIMEText 
-from email.mime.multipart import MIMEMultipart
 import json 
+import hashlib
+from spam_filter import SpamFilter
+from rate_limiter import RateLimiter
+from notifications import NotificationDispatcher
+from metrics import Metrics
 
 class FeedbackManager:
-    def __init__(self):
-        self.rate_limits = {}
+    _word_re = re.compile(r'\b\w+\b')
+    _email_re = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$') #The author learns string parsing from perl (#!/usr/bin/env perl)
+
+    def __init__(self, spam_rules_file: Optional[str] = None, rate_limiter: Optional[RateLimiter] = None,
+                 notifier: Optional[NotificationDispatcher] = None, metrics: Optional[Metrics] = None):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.notifier = notifier or NotificationDispatcher()
+        #rate limit rejections, spam hits and sentiment timings, off unless the app passes its own
+        self.metrics = metrics or Metrics(enabled=False)
+        self.spam_filter = SpamFilter(spam_rules_file)
         self.feedback_categories={
             'general': 'General Feedback',
             'bug': 'Bug Report',
@@ -37,338 +48,675 @@ class FeedbackManager:
             'urgent', 'emergency', 'critical', 'asap', 'immidiately', 'now', 'broken', 'crash', 'error',
             'not working', 'failed', 'stop' 
                             }
+
+        self.critical_phrases = [
+            'not working', 'broken', 'crash', 'error', 'failed', 'urgent', 'emergency',
+            'critical issue'
+        ]
+
+        self.refresh_lexicon()
         
-        def validate_feedback(self, name: str, email:str, subject:str, message:str, feedback_type:str) -> Dict[str, Any]:
-            """validate user feedback, like a complaint or if someone is very upset with my design """
-
-            errors = []
-
-            #Name validation
-            if not name or len(name.strip()) == 0:
-                errors.append("Name is required")
-            elif len(name) > 100:
-                errors.append("Name must be less than 100 characters !")
-            
-            #Email validation 
-            if email and len(email) > 0:
-                if not self.is_valid_email(email):
-                    errors.append("Please enter a valid email")
-                elif len(email) > 255:
-                    errors.append("Email must be shorter than 255 characters!")
-            
-            #Subject validation 
-            if not subject or len(subject.strip()) == 0:
-                errors.append("Subject is required!")
-            elif len(subject) > 200:
-                errors.append("Subject can't exceed 200 characters!")
-            
-            #msg validation (msg = Message)
-            if not message or len(message.strip()) == 0:
-                errors.append("Message is required!")
-            elif len(message) < 10:
-                errors.append("Message must be at least 10 characters!")
-            elif len(message) > 2000:
-                errors.append("Wow too large! max 2000 characters, calm down bro!")
-            
-            #Feedback validation TYPE
-            if feedback_type not in self.feedback_categories:
-                errors.append("Invalid type of feedback!")
-            
-            #Spam control 
-            if self.contains_spam_indicators(message):
-                errors.append("Your message is likely spam!")
-            
-            return {
-                'valid': len(errors) == 0,
-                'message': ''.join(errors) if errors else 'Valid',
-                'errors': errors
-            }
+    def validate_feedback(self, name: str, email:str, subject:str, message:str, feedback_type:str) -> Dict[str, Any]:
+        """validate user feedback, like a complaint or if someone is very upset with my design """
+
+        errors = self.field_errors(name, email, subject, message, feedback_type)
         
-        def is_valid_email(self, email:str) -> bool:
-            pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$' #The author learns string parsing from perl (#!/usr/bin/env perl)
-            return bool(re.match(pattern, email))
+        #Spam control 
+        if self.contains_spam_indicators(message):
+            self.metrics.increment('spam_hits_total')
+            errors.append("Your message is likely spam!")
         
-        def contains_spam_indicators(self, text:str) -> bool:
-            spam_indicators = [
-                r'http[s]?://', #URL , i.e. links, posts etc. 
-                r'[0-9]{10,}', #Long number sequences such as phone numbers, addresses etc.
-                r'[$\£][0-9]+', #money
-                r'(?i)buy now|click here|limited time|offer|discount', #ads or sales 
-                r'(?i)viagra|cialis|weed|meth|drugs', #Obvious 
-                r'[!@#$%^&*()]{5,}', #wierd amount of symbols for a feedback
-            ]
+        return {
+            'valid': len(errors) == 0,
+            'message': ''.join(errors) if errors else 'Valid',
+            'errors': errors
+        }
 
-            for pattern in spam_indicators:
-                if re.search(pattern, text, re.IGNORECASE):
-                    return True #pattern MATCHED
-            return False #no match
+    def validate_feedback_batch(self, rows: List[Dict[str, str]]) -> List[List[str]]:
+        """Errors per row (empty when valid), the spam rules run once over all messages"""
+        errors = [
+            self.field_errors(row.get('name', ''), row.get('email', ''), row.get('subject', ''),
+                              row.get('message', ''), row.get('feedback_type', 'general'))
+            for row in rows
+        ]
+        spam = self.spam_filter.scan((i, row.get('message') or '') for i, row in enumerate(rows))
+        for i in spam:
+            errors[i].append("Your message is likely spam!")
+        if spam:
+            self.metrics.increment('spam_hits_total', amount=len(spam))
+        return errors
+
+    def field_errors(self, name: str, email:str, subject:str, message:str, feedback_type:str) -> List[str]:
+        """Every field rule of validate_feedback, the spam check excepted"""
+        errors = []
+
+        #Name validation
+        if not name or len(name.strip()) == 0:
+            errors.append("Name is required")
+        elif len(name) > 100:
+            errors.append("Name must be less than 100 characters !")
         
-        def check_rate_limit(self, identifier: str, max_requests: int = 5, window_seconds: int = 3600) -> Tuple[bool, int]:
-            now = time.time() 
-            window_start = now - window_seconds
-
-            if identifier not in self.rate_limits:
-                self.rate_limits[identifier] = [] #empty array 
-            
-            self.rate_limits[identifier] = [
-                timestamp for timestamp in self.rate_limits[identifier]
-                if timestamp > window_start
-            ]
-
-            #check current / limit 
-            if len(self.rate_limits[identifier]) >= max_requests:
-                wait_time = int(window_seconds - (now - self.rate_limits[identifier][0]))
-                return False, wait_time
-            
-            #add current request
-            self.rate_limits[identifier].append(now)
+        #Email validation 
+        if email and len(email) > 0:
+            if not self.is_valid_email(email):
+                errors.append("Please enter a valid email")
+            elif len(email) > 255:
+                errors.append("Email must be shorter than 255 characters!")
+        
+        #Subject validation 
+        if not subject or len(subject.strip()) == 0:
+            errors.append("Subject is required!")
+        elif len(subject) > 200:
+            errors.append("Subject can't exceed 200 characters!")
+        
+        #msg validation (msg = Message)
+        if not message or len(message.strip()) == 0:
+            errors.append("Message is required!")
+        elif len(message) < 10:
+            errors.append("Message must be at least 10 characters!")
+        elif len(message) > 2000:
+            errors.append("Wow too large! max 2000 characters, calm down bro!")
+        
+        #Feedback validation TYPE
+        if feedback_type not in self.feedback_categories:
+            errors.append("Invalid type of feedback!")
+        
+        return errors
+    
+    def is_valid_email(self, email:str) -> bool:
+        return bool(self._email_re.match(email))
+    
+    def contains_spam_indicators(self, text:str) -> bool:
+        #rules live in spam_filter.py (or the SPAM_RULES_FILE), all checked in one regex search
+        return self.spam_filter.check(text) is not None
+
+    def rescan_spam(self, feedback_entries: List) -> Dict[int, str]:
+        """Check the existing backlog against the current spam rules, returns {feedback id: rule}"""
+        return self.spam_filter.scan((entry.id, entry.message) for entry in feedback_entries)
+    
+    def check_rate_limit(self, identifier: str, max_requests: int = 5, window_seconds: int = 3600) -> Tuple[bool, int]:
+        #token bucket, max_requests at once and then one more every window_seconds / max_requests
+        with self.metrics.stage('rate_limit'):
+            allowed, wait_time = self.rate_limiter.check(identifier, max_requests, window_seconds)
+        if not allowed:
+            self.metrics.increment('rate_limit_rejections_total')
+        return allowed, wait_time
+    
+    def refresh_lexicon(self) -> None:
+        """Compile the word lists into lookup tables, call again after editing them"""
+        #term -> (positive, negative, urgent) hits
+        hits = defaultdict(lambda: [0, 0, 0])
+        for column, words in enumerate((self.positive_words, self.negative_words, self.urgent_indicators)):
+            for word in words:
+                hits[word.lower()][column] = 1
+
+        self._word_hits = {}
+        #multi-word terms like "not working" are matched as token sequences,
+        #keyed by their first token: first -> [(tokens, hits)]
+        self._phrase_hits = defaultdict(list)
+        for term, counts in hits.items():
+            tokens = tuple(self._word_re.findall(term))
+            if len(tokens) == 1 and tokens[0] == term:
+                self._word_hits[term] = tuple(counts)
+            elif tokens:
+                self._phrase_hits[tokens[0]].append((tokens, tuple(counts)))
+        self._phrase_starts = frozenset(self._phrase_hits)
+
+        #stamped on cached sentiment results, a changed lexicon invalidates them
+        self.lexicon_version = self.compute_lexicon_version()
+
+    def analyze_feedback_sentiment(self, message:str) -> Dict[str, Any]:
+        message_lower = message.lower()
+        words = self._word_re.findall(message_lower)
+        total_words = len(words)
+
+        #single lookup pass for all three word lists, then the rare multi-word terms
+        hits = list(filter(None, map(self._word_hits.get, words)))
+        if not self._phrase_starts.isdisjoint(words):
+            for i, word in enumerate(words):
+                for tokens, phrase_hits in self._phrase_hits.get(word, ()):
+                    if tuple(words[i:i + len(tokens)]) == tokens:
+                        hits.append(phrase_hits)
+
+        positive_count = negative_count = urgent_count = 0
+        if hits:
+            positive_count, negative_count, urgent_count = map(sum, zip(*hits))
+
+        if total_words == 0:
+            sentiment_score = 0
+        else:
+            sentiment_score = (positive_count - negative_count) / total_words
+
+        #Determine sentiment
+        if sentiment_score > 0.1:
+            sentiment = 'positive'
+        elif sentiment_score < -0.1:
+            sentiment = 'negative'
+        else:
+            sentiment = 'neutral'
+        
+        if urgent_count > 0 or negative_count > total_words * 0.3:
+            priority = 'high'
+        elif negative_count > total_words * 0.1:
+            priority = 'medium'
+        else:
+            priority = 'low'
+        
+        #plain substring checks, "errors" and "crashed" count too (faster than a regex alternation)
+        if any(phrase in message_lower for phrase in self.critical_phrases):
+            priority = 'critical'
+        
+        return {
+            'sentiment': sentiment,
+            'sentiment_score': sentiment_score,
+            'positive_words': positive_count,
+            'negative_words': negative_count,
+            'urgent_indicators': urgent_count,
+            'suggested_priority': priority,
+            'word_count': total_words
+        }
 
-            return True, max_requests - len(self.rate_limits[identifier])
+    def analyze_feedback_sentiment_batch(self, messages: List[str]) -> List[Dict[str, Any]]:
+        """Score many messages at once, e.g. for imports or after a lexicon change"""
+        analyze = self.analyze_feedback_sentiment
+        with self.metrics.stage('sentiment'):
+            return [analyze(message) for message in messages]
+
+    def compute_lexicon_version(self) -> str:
+        """Hash of every word list the sentiment analysis depends on"""
+        lexicon = [
+            sorted(self.positive_words), sorted(self.negative_words),
+            sorted(self.urgent_indicators), self.critical_phrases
+        ]
+        return hashlib.sha1(json.dumps(lexicon).encode('utf-8')).hexdigest()[:12]
+
+    def analyze_entry_sentiment(self, feedback_entry) -> Dict[str, Any]:
+        """Full analysis of an entry's message, e.g. for the suggested priority of new feedback.
+        Caches the label for get_entry_sentiment on the way"""
+        with self.metrics.stage('sentiment'):
+            result = self.analyze_feedback_sentiment(feedback_entry.message)
+        feedback_entry.sentiment = result['sentiment']
+        feedback_entry.sentiment_version = self.lexicon_version
+        return result
+
+    def get_entry_sentiment(self, feedback_entry) -> str:
+        """Sentiment label (positive, negative or neutral) of a feedback entry, cached on the entry
+        until the lexicon changes. Only the label is kept, the full analysis would double an entry's size"""
+        cached = getattr(feedback_entry, 'sentiment', None)
+        #entries logged by older versions carry the whole analysis dict, those are scored again
+        if isinstance(cached, str) and getattr(feedback_entry, 'sentiment_version', None) == self.lexicon_version:
+            return cached
+        return self.analyze_entry_sentiment(feedback_entry)['sentiment']
+
+    def filter_feedback(self, feedback_entries: List, status: str = 'all', feedback_type: str = 'all', priority: str = 'all') -> List:
+        """Scan and sort the whole list, the app keeps a FeedbackFilterIndex instead"""
+        filtered = list(feedback_entries)
+        if status != 'all':
+            filtered = [f for f in filtered if f.status == status]
         
-        def analyze_feedback_sentiment(self, message:str) -> Dict[str, Any]:
-            message_lower = message.lower()
-            words = re.findall(r'\b\w+\b', message_lower)
-
-            positive_count = sum(1 for word in words if word in self.positive_words)
-            negative_count = sum(1 for word in words if word in self.negative_words)
-            urgent_count = sum(1 for word in words if word in self.urgent_indicators)
-
-            total_words = len(words)
-
-            if total_words == 0:
-                sentiment_score = 0
-            else:
-                sentiment_score = (positive_count - negative_count) / total_words
-
-            #Determine sentiment
-            if sentiment_score > 0.1:
-                sentiment = 'positive'
-            elif sentiment_score < -0.1:
-                sentiment = 'negative'
-            else:
-                sentiment = 'neutral'
-            
-            if urgent_count > 0 or negative_count > total_words * 0.3:
-                priority = 'high'
-            elif negative_count > total_words * 0.1:
-                priority = 'medium'
-            else:
-                priority = 'low'
-            
-            critical_phrases = [
-                'not working', 'broken', 'crash', 'error', 'failed', 'urgent', 'emergency',
-                'critical issue'
-            ]
+        if feedback_type != 'all':
+            filtered = [f for f in filtered if f.feedback_type == feedback_type]
 
-            for phrase in critical_phrases:
-                if phrase in message_lower:
-                    priority = 'critical'
-                    break
-            
+        if priority != 'all':
+            filtered = [f for f in filtered if f.priority == priority]
+
+        #sort after our will
+        
+        priority_order = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+        filtered.sort(key=lambda x: (priority_order.get(x.priority, 4), x.timestamp), reverse=True)
+        return filtered
+    
+    def get_feedback_stats(self, feedback_entries: List) -> Dict[str, Any]:
+        if not feedback_entries:
             return {
-                'sentiment': sentiment,
-                'sentiment_score': sentiment_score,
-                'positive_words': positive_count,
-                'negative_words': negative_count,
-                'urgent_indicators': urgent_count,
-                'suggested_priority': priority,
-                'word_count': total_words
+                'total_feedback': 0,
+                'by_status': {},
+                'by_type': {},
+                'by_priority': {},
+                'response_rate': 0,
+                'average_response_time': 0
             }
         
+        status_counts = Counter(entry.status for entry in feedback_entries)
+
+        type_counts = Counter(entry.feedback_type for entry in feedback_entries)
+
+        priority_counts = Counter(entry.priority for entry in feedback_entries)
+
+        responded_count = sum(1 for entry in feedback_entries if entry.status in ['resolved', 'closed'])
+        response_rate = (responded_count / len(feedback_entries)) * 100
+
+        #history
+        week_ago = datetime.now() - timedelta(days=7)
+        recent_feedback = [f for f in feedback_entries if f.timestamp > week_ago]
 
-        def filter_feedback(self, feedback_entries: List, status: str = 'all', feedback_type: str = 'all', priority: str = 'all') -> List:
-            filtered = feedback_entries.copy()
-            if status != 'all':
-                filtered = [f for f in filtered if f.status == status]
-            
-            if feedback_type != 'all':
-                filtered = [f for f in filtered if f.feedback_type == feedback_type]
-
-            if priority != 'all':
-                filtered = [f for f in filtered if f.priority == priority]
-
-            #sort after our will
-            
-            priority_order = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
-            filtered.sort(key=lambda x: (priority_order.get(x.priority, 4), x.timestamp), reverse=True)
-            return filtered
+        sentiments_count = Counter(self.get_entry_sentiment(entry) for entry in feedback_entries)
+
+        return {
+            'total_feedback': len(feedback_entries),
+            'recent_feedback': len(recent_feedback),
+            'by_status': dict(status_counts),
+            'by_type': dict(type_counts),
+            'by_priority': dict(priority_counts),
+            'by_sentiment': dict(sentiments_count),
+            'response_rate': round(response_rate, 1),
+            'unresolved_count': status_counts.get('new', 0) + status_counts.get('reviewed', 0),
+            'critical_count': priority_counts.get('critical', 0)
+        }
+    
+    def notify_new_feedback(self, feedback_entry) -> bool:
+        """ Queue a notification, delivered in the background by the notifier (see notifications.py)"""
+        return self.notifier.submit(feedback_entry)
+        
+    def send_email_notification(self, feedback_entry) -> bool:
+        """Deliver a notification right away with the notifier's sender, bypassing the queue"""
+        try:
+            self.notifier.sender.send_batch([feedback_entry.to_dict()])
+            return True
+        
+        except Exception as e:
+            print(f"Error sending email: {e}")
+            return False
+    
+    def export_feedback(self, feedback_entries: List, format:str = 'json') -> str:
+        """Whole export as one string, use feedback_export.iter_export to stream it instead"""
+        from feedback_export import iter_export
+        return ''.join(iter_export(feedback_entries, format))
+    
+    def search_feedback(self, feedback_entries: List, query:str) -> List:
+        """Substring scan over every entry, the app searches through search_index.FeedbackSearchIndex"""
+        if not query:
+            return feedback_entries
         
-        def get_feedback_stats(self, feedback_entries: List) -> Dict[str, Any]:
-            if not feedback_entries:
-                return {
-                    'total_feedback': 0,
-                    'by_status': {},
-                    'by_type': {},
-                    'by_priority': {},
-                    'response_rate': 0,
-                    'average_response_time': 0
-                }
-            
-            status_counts = Counter(entry.status for entry in feedback_entries)
-
-            type_counts = Counter(entry.feedback_type for entry in feedback_entries)
-
-            priority_counts = Counter(entry.priority for entry in feedback_entries)
-
-            responded_count = sum(1 for entry in feedback_entries if entry.status in ['resolved', 'closed'])
-            response_rate = (responded_count / len(feedback_entries)) * 100
-
-            #history
-            week_ago = datetime.now() - timedelta(days=7)
-            recent_feedback = [f for f in feedback_entries if f.timestamp > week_ago]
-
-            sentiments = []
-            for entry in feedback_entries:
-                sentiment_result = self.analyze_feedback_sentiment(entry.message)
-                sentiments.append(sentiment_result['sentiment'])
-            sentiments_count = Counter(sentiments)
+        query_lower = query.lower()
+        results = []
+
+        for entry in feedback_entries:
+            searchable_text = [
+                entry.name,
+                entry.email,
+                entry.subject,
+                entry.message,
+                entry.feedback_type,
+                entry.admin_notes
+            ]
 
-            return {
-                'total_feedback': len(feedback_entries),
-                'recent_feedback': len(recent_feedback),
-                'by_status': dict(status_counts),
-                'by_type': dict(type_counts),
-                'by_priority': dict(priority_counts),
-                'by_sentiment': dict(sentiments_count),
-                'response_rate': round(response_rate, 1),
-                'unresolved_count': status_counts.get('new', 0) + status_counts.get('reviewed', 0),
-                'critical_count': priority_counts.get('critical', 0)
-            }
+            if any(query_lower in str(field).lower() for field in searchable_text if field):
+                results.append(entry)
+
+        return results
+    
+    def get_feedback_trends(self, feedback_entries: List, days: int = 30) -> Dict[str, Any]:
+        """Full scan over the entries, FeedbackTrends keeps the same numbers in pre-aggregated buckets"""
+        if not feedback_entries: 
+            return {}
         
-        def notify_new_feedback(self, feedback_entry) -> bool:
-            """ Send a notification (hypothetical for the author but fun to imagine)"""
-            try:
-                print("====new feedback=====")
-                print(f" ID: {feedback_entry.id}")
-                print(f" FROM: {feedback_entry.name} ({feedback_entry.email})")
-                print(f" TYPE: {feedback_entry.feedback_type}")
-                print(f" SUBJECT: {feedback_entry.subject}")
-                print(f" PRIORITY: {feedback_entry.priority}")
-                print(f" MESSAGE: {feedback_entry.message[:100]}...")
-                print(f" TIMESTAMP: {feedback_entry.timestamp}")
-
-                return True
-            except Exception as e:
-                print(f"Error sending notification: {e}")
-                return False
-            
-        def send_email_notification(self, feedback_entry) -> bool:
-            try:
-                """
-                msg = MIMEMultipart()
-                msg['From'] = 'noreply@felix.com'
-                msg['To'] = 'admin@felix.com'
-                msg['Subject'] = f'New Feedback: {feedback_entry.subject}
-                
-                body = f"""
-                From: {feedback_entry.name}
-                Email: {feedback_entry.email}
-                Type: {feedback_entry.feedback_type}
-                Priority: {feedback_entry.priority}
-
-                Message: {feedback_entry.message}
-                Timestamp: {feedback_entry.timestamp}
-
-                """ 
-                msg.attach(MIMEText(body, 'plain'))
-
-                #SMTP server for email 
-                server = smtplib.SMTP('smtp.felixserver.com', 587 #port 587)
-                server.starttls()
-                server.login('felix@coolguy.com', 'felix_isKing123')
-                server.send_message(msg)
-                server.quit()
-                """
-
-                return True
-            
-            except Exception as e:
-                print(f"Error sending email: {e}")
-                return False
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+
+        #Filter entries
+        period_entries = [
+            entry for entry in feedback_entries if start_date <= entry.timestamp <= end_date]
         
-        def export_feedback(self, feedback_entries: List, format:str = 'json') -> str:
-            if format == 'json': #javascript object notation 
-                data = [entry.to_dict() for entry in feedback_entries]
-                return json.dumps(data, indent=2, default=str)
-            
-            elif format == 'csv': #comma seperated value file (db)
-                csv_lines = ['ID,Name,Email,Type,Subject,Status,Priority,Timestamp']
-                for entry in feedback_entries:
-                    csv_line = [
-                        str(entry.id),
-                        f'"{entry.name}"',
-                        f'"{entry.email}"',
-                        entry.feedback_type,
-                        f'"{entry.subject}"',
-                        entry.status,
-                        entry.priority,
-                        entry.timestamp.isoformat()
-                    ]
-                    csv_lines.append(','.join(csv_line))
-                
-                return '\n'.join(csv_lines)
-            else:
-                raise ValueError(f"Unsupported format: {format}")
+        if not period_entries:
+            return {}
         
-        def search_feedback(self, feedback_entries: List, query:str) -> List:
-            if not query:
-                return feedback_entries
-            
-            query_lower = query.lower()
-            results = []
-
-            for entry in feedback_entries:
-                searchable_text = [
-                    entry.name,
-                    entry.email,
-                    entry.subject,
-                    entry.message,
-                    entry.feedback_type,
-                    entry.admin_notes
-                ]
-
-                if any(query_lower in str(field).lower() for field in searchable_text if field):
-                    results.append(entry)
-
-            return results
+        daily_counts = defaultdict(int)
+        daily_sentiments = defaultdict(lambda: {'positive': 0, 'negative': 0, 'neutral': 0})
+
+        for entry in period_entries:
+            date_str = entry.timestamp.strftime('%Y-%m-%d')
+            daily_counts[date_str] += 1
+
+            daily_sentiments[date_str][self.get_entry_sentiment(entry)] += 1
         
-        def get_feedback_trends(self, feedback_entries: List, days: int = 30) -> Dict[str, Any]:
-            if not feedback_entries: 
-                return {}
-            
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=days)
-
-            #Filter entries
-            period_entries = [
-                entry for entry in feedback_entries if start_date <= entry.timestamp <= end_date]
-            
-            if not period_entries:
-                return {}
-            
-            daily_counts = defaultdict(int)
-            daily_sentiments = defaultdict(lambda: {'positive': 0, 'negative': 0, 'neutral': 0})
-
-            for entry in period_entries:
-                date_str = entry.timestamp.strftime('%Y-%m-%d')
-                daily_counts[date_str] += 1
-
-                sentiment_result = self.analyze_feedback_sentiment(entry.message)
-                daily_sentiments[date_str][sentiment_result['sentiment']] += 1
-            
-            total_days = len(daily_counts)
-            avg_daily = len(period_entries) / total_days if total_days > 0 else 0
+        total_days = len(daily_counts)
+        avg_daily = len(period_entries) / total_days if total_days > 0 else 0
+
+        return {
+            'period': {
+                'start': start_date.strftime('%Y-%m-%d'),
+                'end': end_date.strftime('%Y-%m-%d'),
+                'days': days
+            },
+            'total_feedback': len(period_entries),
+            'daily_average': round(avg_daily, 2),
+            'daily_counts': dict(daily_counts),
+            'daily_sentiments': dict(daily_sentiments),
+            'most_active_day': max(daily_counts, key=daily_counts.get) if daily_counts else None
+        }
+
 
+class FeedbackStats:
+    """Feedback statistics kept up to date as entries change.
+
+    Registered as an index on the feedback collection, so every insert,
+    status/priority change and replayed write adjusts the counters and
+    reading the stats no longer scans (or re-analyzes) every entry.
+    """
+
+    RECENT_DAYS = 7
+
+    def __init__(self, feedback_manager: FeedbackManager):
+        self.feedback_manager = feedback_manager
+        self.status_counts = Counter()
+        self.type_counts = Counter()
+        self.priority_counts = Counter()
+        self.sentiment_counts = Counter()
+        #id -> (status, type, priority, sentiment) as last counted, one shared tuple per combination
+        self._counted: Dict[int, Tuple[str, str, str, str]] = {}
+        self._keys: Dict[Tuple[str, str, str, str], Tuple[str, str, str, str]] = {}
+        self._timestamps = array('q') #sorted epoch seconds (entry._ts), for the recent count
+
+    def update(self, entry) -> None:
+        old = self._counted.get(entry.id)
+        if old is None:
+            insort(self._timestamps, entry._ts)
+        else:
+            self._count(old, -1)
+
+        sentiment = self.feedback_manager.get_entry_sentiment(entry)
+        key = (entry.status, entry.feedback_type, entry.priority, sentiment)
+        key = self._keys.setdefault(key, key)
+        self._counted[entry.id] = key
+        self._count(key, 1)
+
+    def remove(self, entry) -> None:
+        old = self._counted.pop(entry.id, None)
+        if old is None:
+            return
+        self._count(old, -1)
+        index = bisect_left(self._timestamps, entry._ts)
+        if index < len(self._timestamps) and self._timestamps[index] == entry._ts:
+            del self._timestamps[index]
+
+    def _count(self, key: Tuple[str, str, str, str], delta: int) -> None:
+        counters = (self.status_counts, self.type_counts, self.priority_counts, self.sentiment_counts)
+        for counter, value in zip(counters, key):
+            counter[value] += delta
+            if counter[value] == 0:
+                del counter[value] #keep the dicts identical to a full recompute
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Same shape as FeedbackManager.get_feedback_stats"""
+        total = len(self._counted)
+        if total == 0:
             return {
-                'period': {
-                    'start': start_date.strftime('%Y-%m-%d'),
-                    'end': end_date.strftime('%Y-%m-%d'),
-                    'days': days
-                },
-                'total_feedback': len(period_entries),
-                'daily_average': round(avg_daily, 2),
-                'daily_counts': dict(daily_counts),
-                'daily_sentiments': dict(daily_sentiments),
-                'most_active_day': max(daily_counts, key=daily_counts.get) if daily_counts else None
+                'total_feedback': 0,
+                'by_status': {},
+                'by_type': {},
+                'by_priority': {},
+                'response_rate': 0,
+                'average_response_time': 0
             }
 
+        week_ago = (datetime.now() - timedelta(days=self.RECENT_DAYS)).timestamp()
+        recent = len(self._timestamps) - bisect_right(self._timestamps, week_ago)
+        responded = self.status_counts.get('resolved', 0) + self.status_counts.get('closed', 0)
+
+        return {
+            'total_feedback': total,
+            'recent_feedback': recent,
+            'by_status': dict(self.status_counts),
+            'by_type': dict(self.type_counts),
+            'by_priority': dict(self.priority_counts),
+            'by_sentiment': dict(self.sentiment_counts),
+            'response_rate': round(responded / total * 100, 1),
+            'unresolved_count': self.status_counts.get('new', 0) + self.status_counts.get('reviewed', 0),
+            'critical_count': self.priority_counts.get('critical', 0)
+        }
+
+    def verify(self, feedback_entries) -> Dict[str, Tuple[Any, Any]]:
+        """Compare against a full recompute, returns {key: (incremental, recomputed)} for every mismatch"""
+        incremental = self.snapshot()
+        recomputed = self.feedback_manager.get_feedback_stats(feedback_entries)
+        return {
+            key: (incremental.get(key), recomputed.get(key))
+            for key in set(incremental) | set(recomputed)
+            if incremental.get(key) != recomputed.get(key)
+        }
+
+
+class FeedbackTrends:
+    """Per-hour and per-day rollups of feedback counts and sentiment.
+
+    Registered as an index on the feedback collection, so each insert
+    lands in its hour and day bucket. A trend query merges the buckets in
+    its window, which costs O(days) (or O(hours)) rather than O(entries).
+    """
+
+    GRANULARITIES = ('hour', 'day', 'week', 'month')
+    SENTIMENTS = ('positive', 'negative', 'neutral')
+    # longest series a single query may return
+    MAX_BUCKETS = 5000
+
+    def __init__(self, feedback_manager: FeedbackManager):
+        self.feedback_manager = feedback_manager
+        self.hourly: Dict[datetime, Counter] = {}
+        self.daily: Dict[datetime, Counter] = {}
+        self._hours: List[datetime] = [] #sorted bucket starts
+        self._days: List[datetime] = []
+        #id -> hour and sentiment as last counted, packed in one int, see _key
+        self._counted: Dict[int, int] = {}
+
+    def _key(self, entry) -> int:
+        """Epoch seconds of the entry's local hour times 4 plus its sentiment's index in SENTIMENTS"""
+        hour = self.bucket_start(entry.timestamp, 'hour')
+        return int(hour.timestamp()) * 4 + self.SENTIMENTS.index(self.feedback_manager.get_entry_sentiment(entry))
+
+    def update(self, entry) -> None:
+        key = self._key(entry)
+        old = self._counted.get(entry.id)
+        if old == key:
+            return #e.g. only the status changed
+        if old is not None:
+            self._count(old, -1)
+        self._counted[entry.id] = key
+        self._count(key, 1)
+
+    def remove(self, entry) -> None:
+        old = self._counted.pop(entry.id, None)
+        if old is not None:
+            self._count(old, -1)
+
+    def _count(self, key: int, delta: int) -> None:
+        hour, sentiment = divmod(key, 4)
+        hour, sentiment = datetime.fromtimestamp(hour), self.SENTIMENTS[sentiment]
+        for buckets, order, start in ((self.hourly, self._hours, hour),
+                                      (self.daily, self._days, self.bucket_start(hour, 'day'))):
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = Counter()
+                insort(order, start)
+            bucket['count'] += delta
+            bucket[sentiment] += delta
+            if bucket['count'] == 0:
+                del buckets[start]
+                del order[bisect_left(order, start)]
+
+    @staticmethod
+    def bucket_start(moment: datetime, granularity: str) -> datetime:
+        if granularity == 'hour':
+            return moment.replace(minute=0, second=0, microsecond=0)
+        day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if granularity == 'week':
+            return day - timedelta(days=day.weekday())
+        if granularity == 'month':
+            return day.replace(day=1)
+        return day
+
+    @staticmethod
+    def next_bucket(start: datetime, granularity: str) -> datetime:
+        if granularity == 'hour':
+            return start + timedelta(hours=1)
+        if granularity == 'week':
+            return start + timedelta(days=7)
+        if granularity == 'month':
+            return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        return start + timedelta(days=1)
+
+    @staticmethod
+    def _range(order: List[datetime], buckets: Dict[datetime, Counter], start: datetime, end: datetime):
+        """(bucket start, counts) for every non-empty bucket starting in [start, end]"""
+        for key in order[bisect_left(order, start):bisect_right(order, end)]:
+            yield key, buckets[key]
+
+    def series(self, start: datetime, end: datetime, granularity: str = 'day') -> List[Dict[str, Any]]:
+        """Counts per bucket for every bucket overlapping [start, end], oldest first, empty buckets included"""
+        if granularity not in self.GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(self.GRANULARITIES)}")
+        if end < start:
+            raise ValueError("end must not be before start")
+
+        first = self.bucket_start(start, granularity)
+        if granularity == 'hour':
+            source = self._range(self._hours, self.hourly, first, end)
+        else:
+            source = self._range(self._days, self.daily, first, end)
+
+        merged = defaultdict(Counter)
+        for key, bucket in source:
+            merged[self.bucket_start(key, granularity)].update(bucket)
+
+        series = []
+        key = first
+        while key <= end:
+            if len(series) >= self.MAX_BUCKETS:
+                raise ValueError(f"More than {self.MAX_BUCKETS} buckets, use a coarser granularity")
+            bucket = merged.get(key, {})
+            row = {'start': key.isoformat(), 'count': bucket.get('count', 0)}
+            row.update((sentiment, bucket.get(sentiment, 0)) for sentiment in self.SENTIMENTS)
+            series.append(row)
+            key = self.next_bucket(key, granularity)
+        return series
+
+    def snapshot(self, days: int = 30) -> Dict[str, Any]:
+        """Same shape as FeedbackManager.get_feedback_trends.
+
+        The window starts at the hour of now - days: the first, partial day
+        is summed from hourly buckets and the rest from daily ones.
+        """
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        first_day = self.bucket_start(start_date, 'day')
+        second_day = self.next_bucket(first_day, 'day')
+
+        daily_counts = defaultdict(int)
+        daily_sentiments = defaultdict(lambda: {'positive': 0, 'negative': 0, 'neutral': 0})
+
+        def add(day: datetime, bucket: Counter) -> None:
+            date_str = day.strftime('%Y-%m-%d')
+            daily_counts[date_str] += bucket['count']
+            for sentiment in self.SENTIMENTS:
+                daily_sentiments[date_str][sentiment] += bucket[sentiment]
+
+        first_hours = self._range(self._hours, self.hourly, self.bucket_start(start_date, 'hour'),
+                                  min(second_day - timedelta(microseconds=1), end_date))
+        for hour, bucket in first_hours:
+            add(first_day, bucket)
+        for day, bucket in self._range(self._days, self.daily, second_day, end_date):
+            add(day, bucket)
+
+        total = sum(daily_counts.values())
+        if not total:
+            return {}
+
+        return {
+            'period': {
+                'start': start_date.strftime('%Y-%m-%d'),
+                'end': end_date.strftime('%Y-%m-%d'),
+                'days': days
+            },
+            'total_feedback': total,
+            'daily_average': round(total / len(daily_counts), 2),
+            'daily_counts': dict(daily_counts),
+            'daily_sentiments': dict(daily_sentiments),
+            'most_active_day': max(daily_counts, key=daily_counts.get)
+        }
+
+
+class FeedbackFilterIndex:
+    """Secondary indexes behind the admin filters.
+
+    Keeps an id set per status, type and priority plus every entry in the
+    filter_feedback order, both updated as entries change, so filtering
+    intersects sets and reads the pre-sorted order instead of scanning
+    and sorting the whole table.
+    """
+
+    PRIORITY_ORDER = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+    def __init__(self):
+        self.by_status: Dict[str, set] = defaultdict(set)
+        self.by_type: Dict[str, set] = defaultdict(set)
+        self.by_priority: Dict[str, set] = defaultdict(set)
+        self._entries: Dict[int, Any] = {}
+        #id -> (status, type, priority, sort key) as last indexed
+        self._indexed: Dict[int, Tuple[str, str, str, Tuple]] = {}
+        #ascending sort keys, read backwards it is the filter_feedback order
+        self._order: List[Tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sort_key(self, entry) -> Tuple:
+        #-id keeps equal keys in insertion order, like the stable sort did
+        return (self.PRIORITY_ORDER.get(entry.priority, 4), entry._ts, -entry.id)
+
+    def update(self, entry) -> None:
+        indexed = (entry.status, entry.feedback_type, entry.priority, self._sort_key(entry))
+        self._entries[entry.id] = entry #a replayed write brings a new object even if nothing indexed changed
+        old = self._indexed.get(entry.id)
+        if old == indexed:
+            return
+        if old is not None:
+            self._unindex(entry.id, old)
+
+        self.by_status[entry.status].add(entry.id)
+        self.by_type[entry.feedback_type].add(entry.id)
+        self.by_priority[entry.priority].add(entry.id)
+        insort(self._order, indexed[3])
+        self._indexed[entry.id] = indexed
+
+    def remove(self, entry) -> None:
+        old = self._indexed.pop(entry.id, None)
+        if old is not None:
+            self._unindex(entry.id, old)
+            del self._entries[entry.id]
+
+    def _unindex(self, entry_id: int, indexed: Tuple[str, str, str, Tuple]) -> None:
+        status, feedback_type, priority, key = indexed
+        for index, value in ((self.by_status, status), (self.by_type, feedback_type), (self.by_priority, priority)):
+            index[value].discard(entry_id)
+            if not index[value]:
+                del index[value]
+        del self._order[bisect_left(self._order, key)]
+
+    def matching_ids(self, status: str = 'all', feedback_type: str = 'all', priority: str = 'all') -> Optional[set]:
+        """Ids passing the filters, None when nothing is filtered"""
+        selected = [
+            index.get(value, set())
+            for index, value in ((self.by_status, status), (self.by_type, feedback_type), (self.by_priority, priority))
+            if value != 'all'
+        ]
+        if not selected:
+            return None
+        selected.sort(key=len)
+        ids = set(selected[0])
+        for other in selected[1:]:
+            ids &= other
+            if not ids:
+                break
+        return ids
+
+    def filter(self, status: str = 'all', feedback_type: str = 'all', priority: str = 'all') -> List:
+        """Same result as FeedbackManager.filter_feedback"""
+        ids = self.matching_ids(status, feedback_type, priority)
+        if ids is None:
+            return [self._entries[-key[2]] for key in reversed(self._order)]
+
+        #few matches: sort just those, many: walk the pre-sorted order
+        if len(ids) * 8 < len(self._order):
+            keys = sorted((self._indexed[entry_id][3] for entry_id in ids), reverse=True)
+            return [self._entries[-key[2]] for key in keys]
+        return [self._entries[-key[2]] for key in reversed(self._order) if -key[2] in ids]
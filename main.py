@@ -1,30 +1,45 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
-from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, Response, stream_with_context, session, g, current_app
+from flask import before_render_template, template_rendered
+from datetime import datetime, timedelta, timezone
+from functools import partial, wraps
+from time import perf_counter
+import hmac
 import json
 import os 
-from typing import Dict, List, Any
-from feedback_manager import FeedbackManager
+import threading
+from typing import Dict, List, Any, Mapping, Optional
+from feedback_manager import FeedbackManager, FeedbackStats, FeedbackFilterIndex, FeedbackTrends
+from storage import create_store, Record, intern_str, build_record, copy_record
+from rate_limiter import create_rate_limiter
+from notifications import NotificationDispatcher, create_sender
+from pagination import parse_page_args, parse_limit, parse_fields, parse_timestamp, project
+from response_cache import ResponseCache, content_etag
+from serialization import create_encoder, splice, extend_object, EncodedRecords
+from event_hub import EventHub, CollectionEvents, format_sse
+from metrics import Metrics, SamplingProfiler
+#search_index, feedback_export and bulk_import are imported where first needed, most requests never do
 
 
-app = Flask(__name__)
-app.secret_key= 'my-secret-key'
+GUESTBOOK_PAGE_SIZE = 20
+#the query args of paged_api_data, the only ones the list endpoints' cache keys include
+PAGE_ARGS = ('limit', 'cursor', 'order', 'since', 'fields')
+TRENDS_MAX_DAYS = 36600 #100 years
+VALID_STATUSES = ['new', 'reviewed', 'in_progress', 'resolved', 'closed']
+VALID_PRIORITIES = ['low', 'medium', 'high', 'critical']
 
-#memory management
-guestbook_entries = []
-user_history = []
-feedback_entries = []
+class GuestbookEntry(Record):
+    FIELDS = ('id', 'name', 'message', 'email', 'timestamp', 'ip_address', 'user_agent')
+    __slots__ = ('id', 'name', 'message', 'email', '_ts', 'ip_address', 'user_agent')
+    INTERNED = ('ip_address', 'user_agent')
 
-feedback_manager = FeedbackManager()
-
-class GuestbookEntry:
     def __init__(self, name: str, message:str, email:str = None):
-        self.id = len(guestbook_entries) + 1
+        self.id = get_services().guestbook_entries.next_id()
         self.name = name.strip()
         self.message = message.strip()
         self.email = email.strip() if email else None 
         self.timestamp = datetime.now()
-        self.ip_address = request.remote_addr
-        self.user_agent = request.headers.get('User-Agent', 'Unknown')
+        self.ip_address = intern_str(request.remote_addr)
+        self.user_agent = intern_str(request.headers.get('User-Agent', 'Unknown'))
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -37,16 +52,22 @@ class GuestbookEntry:
             'user_agent': self.user_agent
         }
 
-class UserHistory:
+class UserHistory(Record):
+    FIELDS = ('id', 'timestamp', 'action', 'details', 'ip_address', 'user_agent')
+    __slots__ = ('id', '_ts', 'action', 'details', 'ip_address', 'user_agent')
+    INTERNED = ('action', 'ip_address', 'user_agent')
+
     def __init__(self, action:str, details:str):
+        #the id is given by user_history.append()
         self.timestamp = datetime.now()
-        self.action = action
+        self.action = intern_str(action)
         self.details = details
-        self.ip_address = request.remote_addr
-        self.user_agent = request.headers.get('User-Agent', 'Unknown')
+        self.ip_address = intern_str(request.remote_addr)
+        self.user_agent = intern_str(request.headers.get('User-Agent', 'Unknown'))
 
     def to_dict(self) -> Dict[str, Any]:
         return {
+            'id': self.id,
             'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
             'action': self.action,
             'details': self.details,
@@ -58,25 +79,32 @@ class UserHistory:
 def log_user_history(action: str, details: str):
     """ LOG user actions to history """
     history_entry = UserHistory(action, details)
-    user_history.append(history_entry)
-    #Keep only last 100 entries
-    if len(user_history) > 100:
-        user_history.pop(0)
+    #Keeps only the last HISTORY_SIZE entries, user_history.counts keeps the totals per action
+    get_services().user_history.append(history_entry)
+
+class FeedbackEntry(Record):
+    FIELDS = ('id', 'name', 'email', 'subject', 'message', 'feedback_type', 'timestamp', 'status',
+              'priority', 'ip_address', 'user_agent', 'admin_notes')
+    __slots__ = ('id', 'name', 'email', 'subject', 'message', 'feedback_type', '_ts', 'status',
+                 'priority', 'ip_address', 'user_agent', 'admin_notes', 'sentiment', 'sentiment_version')
+    INTERNED = ('feedback_type', 'status', 'priority', 'ip_address', 'user_agent', 'sentiment', 'sentiment_version')
 
-class FeedbackEntry:
     def __init__(self, name: str, email:str, subject: str, message:str, feedback_type: str = 'general'):
-        self.id = len(feedback_entries) +1
+        self.id = get_services().feedback_entries.next_id()
         self.name = name.strip()
         self.email = email.strip()
         self.subject = subject.strip()
         self.message = message.strip()
         self.feedback_type = feedback_type #general, bug etc.
         self.timestamp = datetime.now()
-        self.ip_address = request.remote_addr
-        self.user_agent = request.headers.get('User-Agent', 'Unknown')
+        self.ip_address = intern_str(request.remote_addr)
+        self.user_agent = intern_str(request.headers.get('User-Agent', 'Unknown'))
         self.status = 'new' 
         self.priority = 'medium'
         self.admin_notes = ""
+        #sentiment label, see FeedbackManager.get_entry_sentiment
+        self.sentiment = None
+        self.sentiment_version = None
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -94,27 +122,358 @@ class FeedbackEntry:
             'admin_notes': self.admin_notes 
         }
 
-@app.route('/')
+def load_config(environ: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    """create_app() settings from environment variables, each described in README.md"""
+    config = {
+        'SECRET_KEY': environ.get('SECRET_KEY', 'my-secret-key'),
+        #storage, 'memory://' keeps the old behaviour, 'sqlite:///guestbook.db' persists across restarts and workers
+        'GUESTBOOK_STORAGE': environ.get('GUESTBOOK_STORAGE', 'memory://'),
+        #behind nginx or another proxy, TRUSTED_PROXIES=1 takes the client address from X-Forwarded-For,
+        #otherwise rate limits and history would see every request coming from the proxy
+        'TRUSTED_PROXIES': int(environ.get('TRUSTED_PROXIES', 0)),
+        #compare the incremental feedback stats with a full recompute on every read (slow, for debugging)
+        'FEEDBACK_STATS_CHECK': environ.get('FEEDBACK_STATS_CHECK') == '1',
+        #latency histograms and counters for /metrics, METRICS_PROFILER=1 enables /metrics/profile
+        'METRICS': environ.get('METRICS', '1') != '0',
+        'METRICS_PROFILER': environ.get('METRICS_PROFILER') == '1',
+        'SPAM_RULES_FILE': environ.get('SPAM_RULES_FILE'),
+        #'sqlite:///ratelimit.db' shares rate limits between worker processes
+        'RATE_LIMIT_STORAGE': environ.get('RATE_LIMIT_STORAGE', 'memory://'),
+        #most NDJSON rows one /api/<collection>/bulk request may carry
+        'BULK_MAX_ROWS': int(environ.get('BULK_MAX_ROWS', 10000)),
+        #the bulk endpoints are off until this is set, requests send "Authorization: Bearer <token>"
+        'BULK_IMPORT_TOKEN': environ.get('BULK_IMPORT_TOKEN') or None,
+        #bulk requests per address and hour, 0 for no limit
+        'BULK_RATE_LIMIT': int(environ.get('BULK_RATE_LIMIT', 60)),
+        'HISTORY_SIZE': int(environ.get('HISTORY_SIZE', 100)),
+        #stores history column by column, worth it for a large HISTORY_SIZE
+        'HISTORY_COLUMNAR': environ.get('HISTORY_COLUMNAR') == '1',
+        'STREAM_HISTORY': int(environ.get('STREAM_HISTORY', 1000)),
+        'STREAM_CLIENT_BUFFER': int(environ.get('STREAM_CLIENT_BUFFER', 100)),
+        'RESPONSE_CACHE_SIZE': int(environ.get('RESPONSE_CACHE_SIZE', 256)),
+        #bytes of cached bodies in total and the largest body worth keeping
+        'RESPONSE_CACHE_BYTES': int(environ.get('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024)),
+        'RESPONSE_CACHE_MAX_BODY': int(environ.get('RESPONSE_CACHE_MAX_BODY', 1024 * 1024)),
+        #'auto' uses orjson when installed, 'json' the standard library
+        'JSON_ENCODER': environ.get('JSON_ENCODER', 'auto'),
+        #entries whose encoded JSON is kept for the list endpoints, per collection, about 1 KB each
+        'JSON_CACHE_SIZE': int(environ.get('JSON_CACHE_SIZE', 20000)),
+    }
+    #notifications are printed, or mailed in batches when SMTP_HOST is set, see create_sender
+    config.update((key, value) for key, value in environ.items() if key.startswith(('SMTP_', 'NOTIFY_')))
+    return config
+
+class Services:
+    """Storage, collections, indexes, metrics and live events of one app instance.
+
+    create_app() builds one per app, so several apps in one process share
+    nothing. Views reach theirs with get_services(). The full-text search
+    index is only built by the first search.
+    """
+
+    def __init__(self, config: Mapping[str, Any]):
+        if config['HISTORY_SIZE'] < 1:
+            #an empty ring buffer has no slot to write the next history row into
+            raise ValueError(f"HISTORY_SIZE must be at least 1, got {config['HISTORY_SIZE']}")
+        self.store = create_store(config['GUESTBOOK_STORAGE'])
+
+        self.metrics = Metrics(enabled=config['METRICS'])
+        self.metrics.describe('http_request_duration_seconds', 'Time from the first before_request hook to the response, per route')
+        self.metrics.describe('http_requests_total', 'Responses per route, method and status code')
+        self.metrics.describe('stage_duration_seconds', 'Time spent in one stage of request handling')
+        self.metrics.describe('rate_limit_rejections_total', 'Feedback submissions refused by the rate limiter')
+        self.metrics.describe('spam_hits_total', 'Feedback messages matched by a spam rule')
+        self.profiler = SamplingProfiler() if config['METRICS_PROFILER'] else None
+
+        self.feedback_manager = FeedbackManager(
+            spam_rules_file=config['SPAM_RULES_FILE'],
+            rate_limiter=create_rate_limiter(config['RATE_LIMIT_STORAGE']),
+            notifier=NotificationDispatcher(create_sender(config)),
+            metrics=self.metrics
+        )
+
+        #memory management, every collection writes through to the store and entries are keyed by id
+        self.guestbook_entries = self.store.collection('guestbook', GuestbookEntry)
+        self.user_history = self.store.capped_collection('history', UserHistory, max_len=config['HISTORY_SIZE'],
+                                                         count_by='action', columnar=config['HISTORY_COLUMNAR'])
+        self.feedback_entries = self.store.collection('feedback', FeedbackEntry)
+
+        self.feedback_stats = FeedbackStats(self.feedback_manager)
+        self.feedback_entries.add_index(self.feedback_stats)
+        self.feedback_filters = FeedbackFilterIndex()
+        self.feedback_entries.add_index(self.feedback_filters)
+        self.feedback_trends = FeedbackTrends(self.feedback_manager)
+        self.feedback_entries.add_index(self.feedback_trends)
+        self._feedback_search = None
+        self._search_build_lock = threading.Lock()
+
+        #live events for /api/stream, waiting clients take turns pulling in other workers' writes
+        self.event_hub = EventHub(history=config['STREAM_HISTORY'], client_buffer=config['STREAM_CLIENT_BUFFER'],
+                                  poll=self.store.sync)
+        self.stream_sources = [CollectionEvents(self.event_hub, 'guestbook'),
+                               CollectionEvents(self.event_hub, 'feedback', watch=('status', 'priority'))]
+        self.guestbook_entries.add_index(self.stream_sources[0])
+        self.feedback_entries.add_index(self.stream_sources[1])
+        self.store.sync()
+        for source in self.stream_sources:
+            source.start()
+
+        #rendered pages and API responses, keyed by the versions of the collections they read
+        self.response_cache = ResponseCache(config['RESPONSE_CACHE_SIZE'], config['RESPONSE_CACHE_BYTES'],
+                                            config['RESPONSE_CACHE_MAX_BODY'])
+        #encoded entries for the list endpoints, each kept until the entry is saved again
+        self.encode = create_encoder(config['JSON_ENCODER'])
+        self.guestbook_json = EncodedRecords(self.encode, config['JSON_CACHE_SIZE'])
+        self.guestbook_entries.add_index(self.guestbook_json)
+        self.feedback_json = EncodedRecords(self.encode, config['JSON_CACHE_SIZE'])
+        self.feedback_entries.add_index(self.feedback_json)
+
+    @property
+    def feedback_search(self):
+        """The FeedbackSearchIndex, built from the stored feedback on first use and kept current after.
+
+        The build reads a snapshot outside the store lock, so writes carry on
+        meanwhile, only the catch-up with those writes holds the lock.
+        """
+        index = self._feedback_search
+        if index is None:
+            from search_index import FeedbackSearchIndex
+            with self._search_build_lock:
+                index = self._feedback_search
+                if index is None:
+                    index = FeedbackSearchIndex()
+                    snapshot = self.feedback_entries.snapshot()
+                    for entry in snapshot:
+                        index.update(entry)
+                    self.feedback_entries.attach_index(index, snapshot)
+                    self._feedback_search = index
+        return index
+
+    def close(self) -> None:
+        """Write out buffered log rows, deliver queued notification mails and stop the background threads"""
+        self.store.close()
+        self.feedback_manager.notifier.close()
+
+#(rule, options, view) of every @route, registered on each app create_app() builds
+_routes = []
+
+def route(rule: str, **options):
+    """@app.route for the module level views"""
+    def decorator(view):
+        _routes.append((rule, options, view))
+        return view
+    return decorator
+
+def create_app(config: Optional[Mapping[str, Any]] = None) -> Flask:
+    """A new app with its own Services, configured by load_config() with `config` on top.
+
+    Every call builds an independent instance, e.g. one per test with
+    create_app({'GUESTBOOK_STORAGE': 'memory://', 'METRICS': False}).
+    Background threads start on first use, get_services(app).close()
+    stops them again.
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config or {})
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'],
+                                x_proto=app.config['TRUSTED_PROXIES'])
+
+    services = app.extensions['guestbook'] = Services(app.config)
+
+    for rule, options, view in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for code, handler in ((404, not_found_error), (500, internal_error), (403, forbidden_error),
+                          (400, bad_request_error)):
+        app.register_error_handler(code, handler)
+
+    #the hooks get their Services bound, no lookup on every request
+    if services.metrics.enabled:
+        app.before_request(partial(start_request_timer, services))
+        app.after_request(partial(record_request_metrics, services))
+        before_render_template.connect(start_render_timer, app)
+        template_rendered.connect(record_render_time, app)
+    app.before_request(partial(sync_storage, services))
+    app.after_request(partial(flush_storage, services))
+    return app
+
+def get_services(app: Optional[Flask] = None) -> Services:
+    """The Services of `app`, by default of the app handling the current request"""
+    if app is None:
+        app = current_app
+    return app.extensions['guestbook']
+
+_default_app_lock = threading.Lock()
+
+def __getattr__(name: str):
+    """`main.app` (e.g. `gunicorn main:app`), an app configured from the environment, built on first use"""
+    global app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if 'app' not in globals():
+            app = create_app()
+    return app
+
+def start_request_timer(services: Services):
+    g.request_started = perf_counter()
+
+def sync_storage(services: Services):
+    """Pick up entries written by other workers"""
+    with services.metrics.stage('storage_sync'):
+        services.store.sync()
+
+def flush_storage(services: Services, response):
+    """Commit this request's writes before responding, so the next request sees them in any worker"""
+    services.store.flush()
+    return response
+
+def record_request_metrics(services: Services, response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        #the rule, not the path, so /feedback/admin/update/<int:feedback_id> is one series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        services.metrics.observe('http_request_duration_seconds', perf_counter() - started,
+                                 (('route', route), ('method', request.method)))
+        services.metrics.increment('http_requests_total',
+                                   (('route', route), ('method', request.method), ('status', str(response.status_code))))
+    return response
+
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = perf_counter()
+
+def record_render_time(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        get_services(sender).metrics.observe('stage_duration_seconds', perf_counter() - started, (('stage', 'render'),))
+
+def current_feedback_stats() -> Dict[str, Any]:
+    """Read the incrementally maintained stats, optionally checked against a full recompute"""
+    services = get_services()
+    with services.store.lock: #indexes are only read while no write is half applied
+        if current_app.config['FEEDBACK_STATS_CHECK']:
+            mismatches = services.feedback_stats.verify(services.feedback_entries)
+            if mismatches:
+                current_app.logger.error(f"Feedback stats out of sync: {mismatches}")
+        return services.feedback_stats.snapshot()
+
+def search_feedback_entries(query: str, status: str = 'all', feedback_type: str = 'all',
+                            priority: str = 'all', limit: Optional[int] = None) -> Any:
+    """Full-text search through the inverted index: the (entry, score) pairs best match first,
+    at most `limit` of them, and the number of entries that matched"""
+    services = get_services()
+    index = services.feedback_search #the first call builds it, outside the store lock
+    with services.store.lock:
+        candidates = services.feedback_filters.matching_ids(status, feedback_type, priority)
+        ranked, total = index.search(query, candidates, limit)
+        return [(services.feedback_entries.get(feedback_id), score) for feedback_id, score in ranked], total
+
+def cached_response(render, collections, extra=(), args=()):
+    """Serve render() from the response cache, or 304 while the client's copy is current.
+
+    render() may read only the query `args` named, other args do not make
+    a new cache entry. Only 200 responses are cached. Visitors with pending
+    flash messages always get a fresh render, those are per session.
+    """
+    if '_flashes' in session:
+        return render()
+
+    response_cache = get_services().response_cache
+    key = ((request.endpoint, tuple(request.args.get(name) for name in args), tuple(c.version for c in collections))
+           + tuple(extra))
+    last_modified = max(c.modified for c in collections).astimezone(timezone.utc).replace(microsecond=0)
+
+    response = None
+    cached = response_cache.get(key)
+    if cached is None:
+        response = current_app.make_response(render())
+        if response.status_code != 200:
+            return response
+        body, mimetype = response.get_data(), response.mimetype
+        etag = content_etag(body)
+        response_cache.put(key, (body, mimetype, etag), len(body))
+    else:
+        body, mimetype, etag = cached
+
+    if request.if_none_match:
+        not_modified = etag in request.if_none_match
+    else:
+        not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+
+    if not_modified:
+        response = Response(status=304)
+    elif response is None:
+        response = Response(body, mimetype=mimetype)
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True #clients may keep it, but revalidate every time
+    return response
+
+def cached(*collections, extra=None, args=()):
+    """Decorator for read-only views whose output depends only on the query `args` and the named
+    Services `collections`, e.g. @cached('feedback_entries', args=PAGE_ARGS)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            services = get_services()
+            return cached_response(lambda: view(**kwargs), [getattr(services, name) for name in collections],
+                                   extra() if extra else (), args)
+        return wrapper
+    return decorator
+
+def encode_entries(items, fields=None, encoded=None):
+    """Each item's to_dict() as JSON bytes, from the `encoded` EncodedRecords when every field is wanted"""
+    services = get_services()
+    with services.metrics.stage('serialize'):
+        if fields is None and encoded is not None:
+            return encoded.encode_all(items)
+        return [services.encode(project(item.to_dict(), fields)) for item in items]
+
+def paged_api_data(collection, allowed_fields, encoded=None):
+    """One page of a collection as encoded entries, shaped by the limit/cursor/since/fields query args"""
+    page = parse_page_args(request.args)
+    fields = parse_fields(request.args, allowed_fields)
+    items, next_cursor = collection.page(**page)
+    return encode_entries(items, fields, encoded), next_cursor
+
+def json_list_response(envelope, key, fragments):
+    """Like jsonify(dict(envelope, key=[...])) for entries already encoded by encode_entries"""
+    return Response(splice(get_services().encode, envelope, key, fragments), mimetype='application/json')
+
+@route('/')
 def index():
     """Home page"""
+    services = get_services()
     log_user_history('PAGE_VISIT', 'Visited home page')
     return render_template('index.html', 
-                         total_entries=len(guestbook_entries),
-                         total_visits=len([h for h in user_history if h.action == 'PAGE_VISIT']),
-                         feedback_count=len(feedback_entries))
+                         total_entries=len(services.guestbook_entries),
+                         total_visits=services.user_history.counts['PAGE_VISIT'],
+                         feedback_count=len(services.feedback_entries))
 
-@app.route('/guestbook', methods=['GET', 'POST'])
+@route('/guestbook', methods=['GET', 'POST'])
 def guestbook():
     """Guestbook main page - view entries and add new ones"""
+    services = get_services()
     if request.method == 'POST':
         return handle_post_entry()
     
-    # GET request - show guestbook entries
+    # GET request - show guestbook entries, newest first one page at a time
     log_user_history('PAGE_VISIT', 'Viewed guestbook')
-    return render_template('guestbook.html', entries=guestbook_entries)
+
+    def render():
+        entries, next_cursor = services.guestbook_entries.page(
+            cursor=request.args.get('cursor', type=int), limit=GUESTBOOK_PAGE_SIZE, descending=True
+        )
+        return render_template('guestbook.html', entries=entries, total_entries=len(services.guestbook_entries),
+                               next_cursor=next_cursor)
+
+    return cached_response(render, [services.guestbook_entries], args=('cursor',))
 
 def handle_post_entry():
     """Handle POST request for new guestbook entry"""
+    services = get_services()
     try:
         # Validate required fields
         name = request.form.get('name', '').strip()
@@ -122,29 +481,15 @@ def handle_post_entry():
         email = request.form.get('email', '').strip()
         
         # Validation
-        if not name:
-            flash('Name is required!', 'error')
-            return redirect(url_for('guestbook'))
-        
-        if not message:
-            flash('Message is required!', 'error')
-            return redirect(url_for('guestbook'))
-        
-        if len(name) > 50:
-            flash('Name must be less than 50 characters!', 'error')
-            return redirect(url_for('guestbook'))
-        
-        if len(message) > 500:
-            flash('Message must be less than 500 characters!', 'error')
-            return redirect(url_for('guestbook'))
-        
-        if email and len(email) > 100:
-            flash('Email must be less than 100 characters!', 'error')
+        with services.metrics.stage('validation'):
+            errors = guestbook_entry_errors(name, message, email)
+        if errors:
+            flash(errors[0], 'error')
             return redirect(url_for('guestbook'))
         
         # Create new entry
         new_entry = GuestbookEntry(name, message, email)
-        guestbook_entries.append(new_entry)
+        services.guestbook_entries.append(new_entry)
         
         # Log the action
         log_user_history('NEW_ENTRY', f'Added guestbook entry: {name}')
@@ -153,25 +498,35 @@ def handle_post_entry():
         return redirect(url_for('guestbook'))
         
     except Exception as e:
-        app.logger.error(f"Error adding guestbook entry: {str(e)}")
+        current_app.logger.error(f"Error adding guestbook entry: {str(e)}")
         flash('An error occurred while adding your entry. Please try again.', 'error')
         return redirect(url_for('guestbook'))
 
-@app.route('/guestbook/delete/<int:entry_id>', methods=['POST'])
+def guestbook_entry_errors(name: str, message: str, email: str) -> List[str]:
+    """Every rule a guestbook entry breaks, in the order the form reports them"""
+    errors = []
+    if not name:
+        errors.append('Name is required!')
+    if not message:
+        errors.append('Message is required!')
+    if len(name) > 50:
+        errors.append('Name must be less than 50 characters!')
+    if len(message) > 500:
+        errors.append('Message must be less than 500 characters!')
+    if email and len(email) > 100:
+        errors.append('Email must be less than 100 characters!')
+    return errors
+
+@route('/guestbook/delete/<int:entry_id>', methods=['POST'])
 def delete_entry(entry_id: int):
     """Delete a guestbook entry (admin function)"""
+    services = get_services()
     try:
         # In a real app, you'd have proper authentication
-        global guestbook_entries
-        
-        entry_to_delete = next((entry for entry in guestbook_entries if entry.id == entry_id), None)
-        
-        if not entry_to_delete:
+        if not services.guestbook_entries.delete(entry_id):
             flash('Entry not found!', 'error')
             return redirect(url_for('guestbook'))
         
-        guestbook_entries = [entry for entry in guestbook_entries if entry.id != entry_id]
-        
         # Log the action
         log_user_history('DELETE_ENTRY', f'Deleted entry ID: {entry_id}')
         
@@ -179,82 +534,107 @@ def delete_entry(entry_id: int):
         return redirect(url_for('guestbook'))
         
     except Exception as e:
-        app.logger.error(f"Error deleting entry {entry_id}: {str(e)}")
+        current_app.logger.error(f"Error deleting entry {entry_id}: {str(e)}")
         flash('An error occurred while deleting the entry.', 'error')
         return redirect(url_for('guestbook'))
 
-@app.route('/history')
+@route('/history')
 def view_history():
     """View user activity history"""
+    services = get_services()
     log_user_history('PAGE_VISIT', 'Viewed user history')
-    return render_template('history.html', history=user_history[-50:])  # Show last 50 entries
+    return render_template('history.html', history=services.user_history[-50:])  # Show last 50 entries
 
-@app.route('/api/guestbook')
+@route('/api/guestbook')
+@cached('guestbook_entries', args=PAGE_ARGS)
 def api_guestbook():
     """JSON API endpoint for guestbook entries"""
+    services = get_services()
     try:
-        entries_data = [entry.to_dict() for entry in guestbook_entries]
-        return jsonify({
+        entries_data, next_cursor = paged_api_data(services.guestbook_entries, GuestbookEntry.FIELDS,
+                                                   services.guestbook_json)
+        return json_list_response({
             'status': 'success',
             'count': len(entries_data),
-            'entries': entries_data
-        })
+            'total': len(services.guestbook_entries),
+            'next_cursor': next_cursor
+        }, 'entries', entries_data)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
-        app.logger.error(f"API error: {str(e)}")
+        current_app.logger.error(f"API error: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
         }), 500
 
-@app.route('/api/history')
+@route('/api/history')
 def api_history():
     """JSON API endpoint for user history"""
+    services = get_services()
     try:
-        history_data = [history.to_dict() for history in user_history]
-        return jsonify({
+        #history entries are short lived and never change, encoded fresh every time
+        history_data, next_cursor = paged_api_data(services.user_history, UserHistory.FIELDS)
+        return json_list_response({
             'status': 'success',
             'count': len(history_data),
-            'history': history_data
-        })
+            'total': len(services.user_history),
+            'next_cursor': next_cursor
+        }, 'history', history_data)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
-        app.logger.error(f"API error: {str(e)}")
+        current_app.logger.error(f"API error: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
         }), 500
 
-@app.route('/stats')
+@route('/stats')
 def stats():
     """Display statistics about the guestbook"""
+    services = get_services()
     try:
-        total_entries = len(guestbook_entries)
-        total_history = len(user_history)
-        page_visits = len([h for h in user_history if h.action == 'PAGE_VISIT'])
-        new_entries = len([h for h in user_history if h.action == 'NEW_ENTRY'])
+        total_entries = len(services.guestbook_entries)
+        total_history = services.user_history.total
+        page_visits = services.user_history.counts['PAGE_VISIT']
+        new_entries = services.user_history.counts['NEW_ENTRY']
         
-        # Get unique IP addresses
-        unique_visitors = len(set(entry.ip_address for entry in guestbook_entries))
+        # Get unique IP addresses, only recounted after the guestbook changed
+        unique_key = ('unique_visitors', services.guestbook_entries.version)
+        unique_visitors = services.response_cache.get(unique_key)
+        if unique_visitors is None:
+            unique_visitors = len(set(entry.ip_address for entry in services.guestbook_entries))
+            services.response_cache.put(unique_key, unique_visitors)
         
+        first_entry = services.guestbook_entries.first()
+
         stats_data = {
             'total_entries': total_entries,
             'total_history_events': total_history,
             'page_visits': page_visits,
             'guestbook_entries': new_entries,
             'unique_visitors': unique_visitors,
-            'first_entry_date': guestbook_entries[0].timestamp.strftime('%Y-%m-%d') if guestbook_entries else 'No entries yet'
+            'first_entry_date': first_entry.timestamp.strftime('%Y-%m-%d') if first_entry else 'No entries yet'
         }
         
         log_user_history('PAGE_VISIT', 'Viewed statistics')
         return render_template('stats.html', stats=stats_data)
         
     except Exception as e:
-        app.logger.error(f"Stats error: {str(e)}")
+        current_app.logger.error(f"Stats error: {str(e)}")
         flash('Error loading statistics.', 'error')
         return redirect(url_for('index'))
 
 # FEEDBACK SECTION | DETTA ÄR UPPGIFT 1 IMPLEMENTERING, TITTA REFERENS TILL UPPGIFT I CLASSROOM PÅ WEBBSERVERPROGRAMMERING 1
 
-@app.route('/feedback', methods=['GET', 'POST'])
+@route('/feedback', methods=['GET', 'POST'])
 def feedback():
     """ Main page for feedback - view & submit and/or delete """
     if request.method == 'POST':
@@ -264,9 +644,10 @@ def feedback():
     log_user_history('PAGE_VISIT', 'Viewed feedback page')
     return render_template('feedback.html')
 
-@app.route('/feedback/submit', methods=['POST'])
+@route('/feedback/submit', methods=['POST'])
 def submit_feedback():
     """API ENDPOINT"""
+    services = get_services()
     try:
         #Vi måste validera input fields 
         name = request.form.get('name', '').strip()
@@ -276,16 +657,17 @@ def submit_feedback():
         feedback_type = request.form.get('type', 'general').strip()
 
         #Validering / bekräftning 
-        validation_result = feedback_manager.validate_feedback(
-            name, email, subject, message, feedback_type
-        )
+        with services.metrics.stage('validation'):
+            validation_result = services.feedback_manager.validate_feedback(
+                name, email, subject, message, feedback_type
+            )
         if not validation_result['valid']:
             return jsonify({
                 'status': 'error',
                 'message': validation_result['message']
             }), 400
         
-        can_proceed, wait_time = feedback_manager.check_rate_limit(request.remote_addr)
+        can_proceed, wait_time = services.feedback_manager.check_rate_limit(request.remote_addr)
         if not can_proceed:
             return jsonify({
                 'status': 'error',
@@ -295,17 +677,17 @@ def submit_feedback():
         new_feedback = FeedbackEntry(name, email, subject, message, feedback_type)
 
         #Analyze sentiments && decide priority order (check the feedback_manager.py)
-        sentiment_result = feedback_manager.analyze_feedback_sentiment(message)
+        sentiment_result = services.feedback_manager.analyze_entry_sentiment(new_feedback)
         new_feedback.priority = sentiment_result['suggested_priority']
 
-        feedback_entries.append(new_feedback)
+        services.feedback_entries.append(new_feedback)
 
         #Send to the user log
         log_user_history('FEEDBACK_SUBMITTED', f'submitted feedback: {subject}')
 
         #Skicka en hypotetisk notis / pseudo notis 
 
-        feedback_manager.notify_new_feedback(new_feedback)
+        services.feedback_manager.notify_new_feedback(new_feedback)
 
         return jsonify({
             'status': 'success',
@@ -313,68 +695,79 @@ def submit_feedback():
             'feedback_id': new_feedback.id 
         })
     except Exception as e:
-        app.logger.error(f"Error submitting feedback: {str(e)} ")
+        current_app.logger.error(f"Error submitting feedback: {str(e)} ")
         return jsonify({
             'status': 'error',
             'message': 'Error occured! Try again' 
         }), 500
 
-@app.route('/feedback/thank-you')
+@route('/feedback/thank-you')
 def feedback_thank_you():
     feedback_id = request.args.get('id')
     log_user_history('PAGE_VISIT', 'Viewed feedback thank-you section')
     return render_template('feedback_thank_you.html', feedback_id=feedback_id)
 
-@app.route('/feedback/admin', methods=['GET'])
+@route('/feedback/admin', methods=['GET'])
 def feedback_admin():
+    services = get_services()
     log_user_history('PAGE_VISIT', 'Accessed admin panel')
 
     #filters 
     status_filter = request.args.get('status', 'all')
     type_filter = request.args.get('type', 'all')
     priority_filter = request.args.get('priority', 'all')
+    search_query = request.args.get('q', '').strip()
 
-    #filter 2
-    filtered_feedback = feedback_manager.filter_feedback(
-        feedback_entries, status_filter, type_filter, priority_filter
-    )
+    #filter 2, a search query ranks by relevance instead of priority
+    if search_query:
+        results, _ = search_feedback_entries(search_query, status_filter, type_filter, priority_filter)
+        filtered_feedback = [entry for entry, score in results]
+    else:
+        with services.store.lock:
+            filtered_feedback = services.feedback_filters.filter(status_filter, type_filter, priority_filter)
 
-    stats = feedback_manager.get_feedback_stats(feedback_entries)
+    stats = current_feedback_stats()
 
     return render_template('feedback_admin.html', feedback_entries=filtered_feedback, stats=stats,
                            filters={
                                'status': status_filter,
                                'type': type_filter,
-                               'priority': priority_filter
+                               'priority': priority_filter,
+                               'q': search_query
                            })
 
-@app.route('/feedback/admin/update/<int:feedback_id>', methods=['POST'])
+@route('/feedback/admin/update/<int:feedback_id>', methods=['POST'])
 def update_feedback_status(feedback_id):
+    services = get_services()
     try:
-        feedback_entry = next((f for f in feedback_entries if f.id == feedback_id), None)
-
-        if not feedback_entry:
-            return jsonify({
-                'status': 'error',
-                'message': 'Feedback not found'
-            }), 404
-        
         new_status = request.form.get('status')
         new_priority = request.form.get('priority')
         admin_notes = request.form.get('admin_notes', '')
 
-        #Validation åter igen 
-        valid_statuses = ['new', 'reviewed', 'in_progress', 'resolved', 'closed']
-        valid_priorities = ['low', 'medium', 'high', 'critical']
+        #look up, change and save in one step, so neither concurrent updates nor a sync replacing
+        #the entry with another worker's version can interleave
+        with services.store.lock:
+            feedback_entry = services.feedback_entries.get(feedback_id)
 
-        if new_status and new_status in valid_statuses:
-            feedback_entry.status = new_status
-        
-        if new_priority and new_priority in valid_priorities:
-            feedback_entry.priority = new_priority
-        
-        if admin_notes:
-            feedback_entry.admin_notes = admin_notes.strip()
+            if not feedback_entry:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Feedback not found'
+                }), 404
+
+            changes = {}
+            if new_status and new_status in VALID_STATUSES:
+                changes['status'] = new_status
+            
+            if new_priority and new_priority in VALID_PRIORITIES:
+                changes['priority'] = new_priority
+            
+            if admin_notes:
+                changes['admin_notes'] = admin_notes.strip()
+
+            #only the fields set here are logged, other workers' edits to the rest survive
+            if changes:
+                services.feedback_entries.save(copy_record(feedback_entry, **changes), tuple(changes))
 
         #log 
         log_user_history('FEEDBACK_UPDATED', f'updates feedback ID: {feedback_id}')
@@ -384,41 +777,545 @@ def update_feedback_status(feedback_id):
             'message': 'Feedback updated' 
         })
     except Exception as e:
-        app.logger.error(f"Error updating feedback {feedback_id} : {str(e)}")
+        current_app.logger.error(f"Error updating feedback {feedback_id} : {str(e)}")
         return jsonify({
             'status': 'error',
             'message': 'An error occured while updating the feedback'
         }), 500
 
-@app.route('/api/feedback')
-def api_feedback():
+@route('/feedback/admin/update', methods=['POST'])
+def bulk_update_feedback():
+    """Set status, priority and/or admin notes on many entries in one request.
+
+    JSON body with either `ids` (a list of feedback ids) or `filter`
+    ({status, type, priority, q} as on the admin page), plus the new
+    `status`, `priority` and/or `admin_notes`. A plain form may send the
+    ids as repeated `ids` fields. All or nothing: an invalid value or an
+    unknown id changes no entry.
+    """
+    services = get_services()
     try:
-        feedback_data = [entry.to_dict() for entry in feedback_entries]
+        data = request.get_json(silent=True)
+        if data is None:
+            data = dict(request.form.items(), ids=request.form.getlist('ids') or None)
+        elif not isinstance(data, dict):
+            raise ValueError('Body must be a JSON object')
+
+        changes = {}
+        for field, valid in (('status', VALID_STATUSES), ('priority', VALID_PRIORITIES)):
+            value = data.get(field)
+            if value:
+                if value not in valid:
+                    raise ValueError(f"{field} must be one of {', '.join(valid)}")
+                changes[field] = intern_str(value)
+        if data.get('admin_notes'):
+            changes['admin_notes'] = str(data['admin_notes']).strip()
+        if not changes:
+            raise ValueError('Nothing to change, give a status, priority or admin_notes')
+
+        ids, query = data.get('ids'), data.get('filter')
+        if (ids is None) == (query is None):
+            raise ValueError('Give either ids or filter')
+        if ids is not None:
+            if not isinstance(ids, list):
+                raise ValueError('ids must be a list')
+            ids = [int(feedback_id) for feedback_id in ids]
+        elif not isinstance(query, dict):
+            raise ValueError('filter must be an object')
+        else:
+            for field in ('q', 'status', 'type', 'priority'):
+                if not isinstance(query.get(field, ''), str):
+                    raise ValueError(f'filter.{field} must be a string')
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    try:
+        #select, change and save in one step, nobody sees half of the batch applied
+        with services.store.lock:
+            if ids is not None:
+                missing = [feedback_id for feedback_id in ids if feedback_id not in services.feedback_entries]
+                if missing:
+                    return jsonify({
+                        'status': 'error',
+                        'message': f"Feedback not found: {', '.join(map(str, missing))}"
+                    }), 404
+                entries = [services.feedback_entries.get(feedback_id) for feedback_id in dict.fromkeys(ids)]
+            elif query.get('q', '').strip():
+                results, _ = search_feedback_entries(
+                    query['q'].strip(), query.get('status', 'all'), query.get('type', 'all'),
+                    query.get('priority', 'all')
+                )
+                entries = [entry for entry, score in results]
+            else:
+                matching = services.feedback_filters.matching_ids(
+                    query.get('status', 'all'), query.get('type', 'all'), query.get('priority', 'all')
+                )
+                entries = [entry for entry in services.feedback_entries.snapshot() if matching is None or entry.id in matching]
+
+            changed = [
+                copy_record(entry, **changes) for entry in entries
+                if any(getattr(entry, field) != value for field, value in changes.items())
+            ]
+            services.feedback_entries.save_many(changed, tuple(changes))
+
+        if changed:
+            summary = ', '.join(f'{field}={value}' for field, value in changes.items() if field != 'admin_notes')
+            log_user_history('FEEDBACK_BULK_UPDATED', f'updated {len(changed)} feedback entries {summary}'.rstrip())
 
         return jsonify({
             'status': 'success',
-            'count': len(feedback_data),
-            'feedback': feedback_data
+            'matched': len(entries),
+            'updated': len(changed),
+            'ids': [entry.id for entry in changed]
         })
     except Exception as e:
-        app.logger.error(f"API error: {str(e)}")
+        current_app.logger.error(f"Error in bulk feedback update: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'An error occured while updating the feedback'
+        }), 500
+
+@route('/api/feedback')
+@cached('feedback_entries', args=PAGE_ARGS)
+def api_feedback():
+    services = get_services()
+    try:
+        feedback_data, next_cursor = paged_api_data(services.feedback_entries, FeedbackEntry.FIELDS,
+                                                    services.feedback_json)
+
+        return json_list_response({
+            'status': 'success',
+            'count': len(feedback_data),
+            'total': len(services.feedback_entries),
+            'next_cursor': next_cursor
+        }, 'feedback', feedback_data)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f"API error: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': 'Internal error'
         }), 500
 
-@app.route('/api/feedback/stats')
+@route('/api/feedback/search')
+def api_feedback_search():
+    """Ranked full-text search, e.g. /api/feedback/search?q=login crash&status=new&limit=20"""
+    services = get_services()
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({
+                'status': 'error',
+                'message': 'Query parameter q is required'
+            }), 400
+
+        limit = parse_limit(request.args, 50)
+        fields = parse_fields(request.args, FeedbackEntry.FIELDS)
+        shown, total = search_feedback_entries(
+            query,
+            request.args.get('status', 'all'),
+            request.args.get('type', 'all'),
+            request.args.get('priority', 'all'),
+            limit
+        )
+
+        fragments = encode_entries([entry for entry, _ in shown], fields, services.feedback_json)
+        return json_list_response({
+            'status': 'success',
+            'query': query,
+            'total': total,
+            'count': len(shown),
+        }, 'results', [
+            extend_object(services.encode, fragment, {'score': round(score, 3)})
+            for fragment, (_, score) in zip(fragments, shown)
+        ])
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f"API error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+
+@route('/api/feedback/export')
+def api_feedback_export():
+    """Stream all (or filtered) feedback, e.g. /api/feedback/export?format=csv&compress=gzip"""
+    from feedback_export import EXPORT_FORMATS, iter_export, gzip_chunks
+    services = get_services()
+    export_format = request.args.get('format', 'ndjson')
+    compress = request.args.get('compress')
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported format: {export_format}")
+        if compress not in (None, 'gzip'):
+            raise ValueError("compress must be 'gzip'")
+
+        with services.store.lock:
+            ids = services.feedback_filters.matching_ids(
+                request.args.get('status', 'all'),
+                request.args.get('type', 'all'),
+                request.args.get('priority', 'all')
+            )
+        entries = services.feedback_entries.iter_pages()
+        if ids is not None:
+            entries = (entry for entry in entries if entry.id in ids)
+
+        chunks = iter_export(entries, export_format)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f'feedback.{extension}'
+    if compress == 'gzip':
+        chunks = gzip_chunks(chunks)
+        mimetype, filename = 'application/gzip', filename + '.gz'
+
+    log_user_history('FEEDBACK_EXPORTED', f'Exported feedback as {export_format}')
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+# BULK IMPORT, NDJSON rows of historic data or backups (e.g. /api/feedback/export output)
+
+def bulk_row_state(row: Dict[str, Any], text_fields, errors: List[str]) -> Dict[str, Any]:
+    """Stripped text fields and the optional ISO timestamp of one imported row"""
+    state = {}
+    for field in text_fields:
+        value = row.get(field)
+        if value is None:
+            state[field] = ''
+        elif not isinstance(value, str):
+            errors.append(f'{field} must be a string')
+        elif not is_encodable(value):
+            errors.append(f'{field} is not valid UTF-8')
+        else:
+            state[field] = value.strip()
+    if row.get('timestamp') is not None:
+        try:
+            timestamp = datetime.fromisoformat(row['timestamp'])
+        except (TypeError, ValueError):
+            errors.append('timestamp must be an ISO date')
+            return state
+        try:
+            #stored as epoch seconds and shown in local time, both have to work for every page to render
+            datetime.fromtimestamp(int(timestamp.timestamp()))
+            state['timestamp'] = timestamp
+        except (OverflowError, OSError, ValueError):
+            errors.append('timestamp is out of range')
+    return state
+
+def is_encodable(value: str) -> bool:
+    """False for strings with lone surrogates (e.g. a JSON '\\ud800'), which no page or JSON response can encode"""
+    try:
+        value.encode('utf-8')
+        return True
+    except UnicodeEncodeError:
+        return False
+
+def bulk_insert(collection, record_cls, states: List[Dict[str, Any]], errors: List[Dict[str, Any]],
+                ip_address: str, user_agent: str, atomic: bool = False) -> Dict[str, Any]:
+    """Build records from validated rows and add them all in one write.
+
+    Rows without their own timestamp, ip_address or user_agent get the
+    import's. Ids are always new, the collection's own sequence continues.
+    With `atomic` nothing is written if any row was rejected.
+    """
+    if not states or (atomic and errors):
+        return {'imported': 0, 'ids': [], 'errors': errors}
+
+    now = datetime.now()
+    records = []
+    for record_id, state in zip(collection.next_ids(len(states)), states):
+        state['id'] = record_id
+        state['timestamp'] = state.get('timestamp') or now
+        state['ip_address'] = state.get('ip_address') or ip_address
+        state['user_agent'] = state.get('user_agent') or user_agent
+        records.append(build_record(record_cls, state))
+    collection.extend(records)
+    return {'imported': len(records), 'ids': [record.id for record in records], 'errors': errors}
+
+def import_guestbook(rows, ip_address: str, user_agent: str, atomic: bool = False,
+                     rejected=()) -> Dict[str, Any]:
+    """Insert (line number, row) pairs as guestbook entries, see bulk_insert.
+
+    `rejected` are errors of lines that never became rows (unparsable JSON),
+    reported along and with `atomic` enough to stop the import.
+    """
+    states, errors = [], list(rejected)
+    for line, row in rows:
+        row_errors = []
+        state = bulk_row_state(row, ('name', 'message', 'email', 'ip_address', 'user_agent'), row_errors)
+        row_errors = row_errors or guestbook_entry_errors(state['name'], state['message'], state['email'])
+        if row_errors:
+            errors.append({'line': line, 'errors': row_errors})
+            continue
+        state['email'] = state['email'] or None
+        states.append(state)
+    return bulk_insert(get_services().guestbook_entries, GuestbookEntry, states, errors, ip_address, user_agent, atomic)
+
+def import_feedback(rows, ip_address: str, user_agent: str, atomic: bool = False,
+                    rejected=()) -> Dict[str, Any]:
+    """Insert (line number, row) pairs as feedback, validated and scored a whole batch at a time.
+
+    Rows may carry their status, priority and admin_notes, a missing
+    priority is suggested by the sentiment analysis as for new feedback.
+    The form's field name 'type' works for 'feedback_type'. No
+    notifications are sent and no rate limit applies. `rejected` as for
+    import_guestbook.
+    """
+    services = get_services()
+    lines, states, row_errors = [], [], []
+    for line, row in rows:
+        if 'feedback_type' not in row and 'type' in row:
+            row = dict(row, feedback_type=row['type'])
+        errors = []
+        state = bulk_row_state(row, ('name', 'email', 'subject', 'message', 'feedback_type', 'status',
+                                     'priority', 'admin_notes', 'ip_address', 'user_agent'), errors)
+        state['feedback_type'] = state.get('feedback_type') or 'general'
+        state['status'] = state.get('status') or 'new'
+        if state['status'] not in VALID_STATUSES:
+            errors.append(f"status must be one of {', '.join(VALID_STATUSES)}")
+        if state.get('priority') and state['priority'] not in VALID_PRIORITIES:
+            errors.append(f"priority must be one of {', '.join(VALID_PRIORITIES)}")
+        lines.append(line)
+        states.append(state)
+        row_errors.append(errors)
+
+    valid, errors = [], list(rejected)
+    with services.metrics.stage('validation'):
+        checked = services.feedback_manager.validate_feedback_batch(states)
+    for line, state, parse_errors, field_errors in zip(lines, states, row_errors, checked):
+        if parse_errors or field_errors:
+            errors.append({'line': line, 'errors': parse_errors + field_errors})
+        else:
+            valid.append(state)
+    if atomic and errors:
+        valid = []
+
+    sentiments = services.feedback_manager.analyze_feedback_sentiment_batch([state['message'] for state in valid])
+    for state, sentiment in zip(valid, sentiments):
+        state['sentiment'] = sentiment['sentiment']
+        state['sentiment_version'] = services.feedback_manager.lexicon_version
+        state['priority'] = state['priority'] or sentiment['suggested_priority']
+    return bulk_insert(services.feedback_entries, FeedbackEntry, valid, errors, ip_address, user_agent, atomic)
+
+def check_bulk_access():
+    """Error response unless bulk import is enabled, the token matches and the caller is within BULK_RATE_LIMIT"""
+    token = current_app.config['BULK_IMPORT_TOKEN']
+    if not token:
+        return jsonify({
+            'status': 'error',
+            'message': 'Bulk import is disabled, set BULK_IMPORT_TOKEN to enable it'
+        }), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                               f'Bearer {token}'.encode('utf-8')):
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing or wrong bulk import token'
+        }), 401
+
+    #one token per request whatever its size, BULK_MAX_ROWS bounds the rows
+    max_requests = current_app.config['BULK_RATE_LIMIT']
+    if max_requests:
+        can_proceed, wait_time = get_services().feedback_manager.check_rate_limit(
+            f'bulk:{request.remote_addr}', max_requests, 3600
+        )
+        if not can_proceed:
+            return jsonify({
+                'status': 'error',
+                'message': f'Rate limit exceeded, wait {wait_time} seconds and try again.'
+            }), 429, {'Retry-After': str(wait_time)}
+    return None
+
+def handle_bulk_import(import_rows, collection_name: str):
+    """Shared body of the /api/<collection>/bulk endpoints"""
+    from bulk_import import read_ndjson
+    denied = check_bulk_access()
+    if denied is not None:
+        return denied
+    try:
+        rows, errors = read_ndjson(request.get_data(as_text=True).splitlines())
+        max_rows = current_app.config['BULK_MAX_ROWS']
+        if len(rows) + len(errors) > max_rows:
+            return jsonify({
+                'status': 'error',
+                'message': f'At most {max_rows} rows per request'
+            }), 413
+
+        atomic = request.args.get('atomic') == '1'
+        result = import_rows(rows, intern_str(request.remote_addr),
+                             intern_str(request.headers.get('User-Agent', 'Unknown')), atomic, errors)
+        result['errors'].sort(key=lambda error: error['line'])
+        result['received'] = len(rows) + len(errors)
+        if atomic and result['errors']:
+            return jsonify(dict(result, status='error', message='No rows imported, fix the errors and retry')), 400
+
+        if result['imported']:
+            log_user_history('BULK_IMPORT', f"Imported {result['imported']} {collection_name} entries")
+        return jsonify(dict(result, status='success'))
+    except Exception as e:
+        current_app.logger.error(f"Bulk import error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+
+@route('/api/guestbook/bulk', methods=['POST'])
+def api_guestbook_bulk():
+    """Import guestbook entries, one JSON object per line, ?atomic=1 for all or nothing"""
+    return handle_bulk_import(import_guestbook, 'guestbook')
+
+@route('/api/feedback/bulk', methods=['POST'])
+def api_feedback_bulk():
+    """Import feedback, one JSON object per line, ?atomic=1 for all or nothing"""
+    return handle_bulk_import(import_feedback, 'feedback')
+
+@route('/api/feedback/stats')
+@cached('feedback_entries', extra=lambda: (datetime.now().strftime('%Y-%m-%d %H:%M'),)) #recent_feedback moves with the clock
 def api_feedback_stats():
     """JSON API endpoint for feedback statistics"""
     try:
-        stats = feedback_manager.get_feedback_stats(feedback_entries)
+        stats = current_feedback_stats()
         
         return jsonify({
             'status': 'success',
             'stats': stats
         })
     except Exception as e:
-        app.logger.error(f"API error: {str(e)}")
+        current_app.logger.error(f"API error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+
+@route('/api/feedback/trends')
+def api_feedback_trends():
+    """Feedback counts per hour/day/week/month, e.g. ?granularity=week&days=90 or ?start=2025-01-01&end=2025-03-31"""
+    services = get_services()
+    try:
+        granularity = request.args.get('granularity', 'day')
+        #start/end with an offset (2025-01-01T00:00:00Z) become naive local time like the stored timestamps
+        end = request.args.get('end')
+        end = parse_timestamp(end) if end else datetime.now()
+        start = request.args.get('start')
+        if start:
+            start = parse_timestamp(start)
+        else:
+            days = int(request.args.get('days', 30))
+            if not 0 <= days <= TRENDS_MAX_DAYS:
+                raise ValueError(f"days must be from 0 to {TRENDS_MAX_DAYS}")
+            start = end - timedelta(days=days)
+
+        with services.store.lock:
+            buckets = services.feedback_trends.series(start, end, granularity)
+    except OverflowError:
+        return jsonify({
+            'status': 'error',
+            'message': 'Dates out of range'
+        }), 400
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        'status': 'success',
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total': sum(bucket['count'] for bucket in buckets),
+        'buckets': buckets
+    })
+
+def stream_cursor(event_hub: EventHub, last_id):
+    """Sequence number a client resumes after, and whether it has to be told to reset"""
+    after = event_hub.parse_event_id(last_id)
+    reset = last_id is not None and after is None
+    if after is None:
+        after = event_hub.last_seq
+    return after, reset
+
+def poll_timeout(value) -> float:
+    try:
+        return min(float(value or 25), 60)
+    except ValueError:
+        raise ValueError('timeout must be a number')
+
+def poll_response_data(event_hub: EventHub, events, lost: int, after: int, reset: bool) -> Dict[str, Any]:
+    """Body of a long-poll response, shared with the ASGI stream in asgi.py"""
+    if events:
+        after = events[-1][0]
+    return {
+        'status': 'success',
+        'reset': reset,
+        'lost': lost,
+        'last_id': event_hub.event_id(after),
+        'events': [
+            {'id': event_hub.event_id(seq), 'type': event_type, 'data': data}
+            for seq, event_type, data in events
+        ]
+    }
+
+@route('/api/stream')
+def api_stream():
+    """New guestbook entries, feedback and status changes as Server-Sent Events, or long-poll with ?poll=1
+
+    Resume with the Last-Event-ID header (sent automatically by EventSource)
+    or ?last_id=. An id this worker did not issue gets a `reset` event
+    and continues from now, the client should refetch the lists.
+    """
+    services = get_services()
+    after, reset = stream_cursor(services.event_hub, request.headers.get('Last-Event-ID') or request.args.get('last_id'))
+
+    if request.args.get('poll'):
+        try:
+            timeout = poll_timeout(request.args.get('timeout'))
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        events, lost = services.event_hub.wait(after, timeout)
+        return jsonify(poll_response_data(services.event_hub, events, lost, after, reset))
+
+    def generate():
+        if reset:
+            yield format_sse(services.event_hub.event_id(after), 'reset', {})
+        yield from services.event_hub.stream(after)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/api/feedback/spam')
+def api_feedback_spam():
+    """Rescan all stored feedback with the current spam rules"""
+    services = get_services()
+    try:
+        flagged = services.feedback_manager.rescan_spam(services.feedback_entries)
+
+        return jsonify({
+            'status': 'success',
+            'rules_version': services.feedback_manager.spam_filter.version,
+            'rules_error': services.feedback_manager.spam_filter.error,
+            'count': len(flagged),
+            'flagged': [{'id': entry_id, 'rule': rule} for entry_id, rule in flagged.items()]
+        })
+    except Exception as e:
+        current_app.logger.error(f"API error: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
@@ -426,6 +1323,7 @@ def api_feedback_stats():
 
 def handle_feedback_submission():
     """Handle POST request for new feedback (form submission)"""
+    services = get_services()
     try:
         name = request.form.get('name', '').strip()
         email = request.form.get('email', '').strip()
@@ -434,16 +1332,17 @@ def handle_feedback_submission():
         feedback_type = request.form.get('type', 'general').strip()
         
         # Validation
-        validation_result = feedback_manager.validate_feedback(
-            name, email, subject, message, feedback_type
-        )
+        with services.metrics.stage('validation'):
+            validation_result = services.feedback_manager.validate_feedback(
+                name, email, subject, message, feedback_type
+            )
         
         if not validation_result['valid']:
             flash(validation_result['message'], 'error')
             return redirect(url_for('feedback'))
         
         # Check rate limiting
-        can_proceed, wait_time = feedback_manager.check_rate_limit(request.remote_addr)
+        can_proceed, wait_time = services.feedback_manager.check_rate_limit(request.remote_addr)
         if not can_proceed:
             flash(f'Rate limit exceeded. Please try again in {wait_time} seconds.', 'error')
             return redirect(url_for('feedback'))
@@ -452,46 +1351,77 @@ def handle_feedback_submission():
         new_feedback = FeedbackEntry(name, email, subject, message, feedback_type)
         
         # Analyze sentiment and set priority
-        sentiment_result = feedback_manager.analyze_feedback_sentiment(message)
+        sentiment_result = services.feedback_manager.analyze_entry_sentiment(new_feedback)
         new_feedback.priority = sentiment_result['suggested_priority']
         
-        feedback_entries.append(new_feedback)
+        services.feedback_entries.append(new_feedback)
         
         # Log the action
         log_user_history('FEEDBACK_SUBMITTED', f'Submitted feedback: {subject}')
         
         # Send notification
-        feedback_manager.notify_new_feedback(new_feedback)
+        services.feedback_manager.notify_new_feedback(new_feedback)
         
         flash('Thank you for your feedback! We will review it soon.', 'success')
         return redirect(url_for('feedback_thank_you', id=new_feedback.id))
         
     except Exception as e:
-        app.logger.error(f"Error submitting feedback: {str(e)}")
+        current_app.logger.error(f"Error submitting feedback: {str(e)}")
         flash('An error occurred while submitting your feedback. Please try again.', 'error')
         return redirect(url_for('feedback'))
 
+@route('/metrics')
+def prometheus_metrics():
+    """Latency histograms and counters of this worker in Prometheus text format"""
+    services = get_services()
+    return Response(services.metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@route('/api/metrics')
+def api_metrics():
+    """The same numbers as JSON, with p50/p95/p99 estimates per route and stage"""
+    services = get_services()
+    return jsonify(dict(services.metrics.summary(), status='success', enabled=services.metrics.enabled))
+
+@route('/metrics/profile')
+def metrics_profile():
+    """Sample every thread for ?seconds=5 (at most 60), as collapsed stacks for flamegraph.pl or speedscope"""
+    services = get_services()
+    if services.profiler is None:
+        abort(404)
+    try:
+        seconds = min(float(request.args.get('seconds', 5)), 60)
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'seconds must be a number'
+        }), 400
+
+    stacks = services.profiler.profile(seconds)
+    if stacks is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'A profile is already being taken'
+        }), 409
+    return Response(stacks, mimetype='text/plain')
+
 
 # Error Handlers
-@app.errorhandler(404)
 def not_found_error(error):
     log_user_history('ERROR', '404 Page Not Found')
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
 def internal_error(error):
     log_user_history('ERROR', '500 Internal Server Error')
     return render_template('500.html'), 500
 
-@app.errorhandler(403)
 def forbidden_error(error):
     log_user_history('ERROR', '403 Forbidden')
     return render_template('error.html', error_code=403, error_message="Forbidden"), 403
 
-@app.errorhandler(400)
 def bad_request_error(error):
     log_user_history('ERROR', '400 Bad Request')
     return render_template('error.html', error_code=400, error_message="Bad Request"), 400
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    #development server with the debugger, deploy with serve.py instead
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
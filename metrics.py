@@ -0,0 +1,220 @@
+"""Request latency histograms, counters and an opt-in sampling profiler.
+
+Histograms have fixed buckets like Prometheus ones, so recording a
+value is one bisect and a few additions under a lock, and p50/p95/p99
+are estimated from the buckets the way histogram_quantile() does. Every
+worker process keeps its own numbers; scrape each worker, or run one.
+"""
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# upper bounds in seconds, from 50 microseconds to 10 seconds
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# (('route', '/api/feedback'), ('method', 'GET')) - label pairs in a fixed order
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, bounds: Tuple[float, ...] = BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) #the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate, interpolating linearly inside the bucket the rank falls into"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+
+class StageTimer:
+    """Context manager that records its duration as one observation"""
+
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics: 'Metrics', name: str, labels: Labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> 'StageTimer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.started, self.labels)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Metrics:
+    """Named histograms and counters, each split by a tuple of label pairs"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        #one flat dict per kind, (name, labels) -> series, the hot path is a single lookup
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Counter = Counter()
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.counts[bisect_left(histogram.bounds, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def increment(self, name: str, labels: Labels = (), amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name, labels] += amount
+
+    def stage(self, stage: str) -> Any:
+        """Time a block as one stage of request handling, e.g. `with metrics.stage('validation'):`"""
+        if not self.enabled:
+            return _NO_TIMER
+        return StageTimer(self, 'stage_duration_seconds', (('stage', stage),))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        """Every series as plain data with count, sum and the p50/p95/p99 estimates"""
+        histograms: Dict[str, List[Dict[str, Any]]] = {}
+        counters: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for (name, labels), h in sorted(self._histograms.items()):
+                histograms.setdefault(name, []).append(dict(
+                    dict(labels), count=h.count, sum=round(h.sum, 6),
+                    **{f'p{round(q * 100)}': round(h.quantile(q), 6) for q in QUANTILES}
+                ))
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append(dict(dict(labels), value=value))
+        return {'histograms': histograms, 'counters': counters}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            previous = None
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name != previous:
+                    self._header(lines, name, 'histogram')
+                    previous = name
+                cumulative = 0
+                for bound, count in zip(h.bounds + (float('inf'),), h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f'{name}_sum{_format_labels(labels)} {h.sum!r}')
+                lines.append(f'{name}_count{_format_labels(labels)} {h.count}')
+            previous = None
+            for (name, labels), value in sorted(self._counters.items()):
+                if name != previous:
+                    self._header(lines, name, 'counter')
+                    previous = name
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f'# HELP {name} {self._help[name]}')
+        lines.append(f'# TYPE {name} {kind}')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class SamplingProfiler:
+    """Samples the stack of every other thread at a fixed interval while running.
+
+    Results are collapsed stacks ("module:function;module:function count"
+    per line), the input format of flamegraph.pl and speedscope. Costs
+    nothing until started.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float) -> Optional[str]:
+        """Sample for `seconds` and return the collapsed stacks, None if a run is already going on"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            self.stacks.clear()
+            self.samples = 0
+            me = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != me:
+                        self.stacks[self._collapse(frame)] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
@@ -0,0 +1,220 @@
+"""Background delivery of new-feedback notifications.
+
+Requests only put a snapshot of the feedback on a bounded queue. A worker
+thread drains it in batches, hands each batch to a sender (console or
+SMTP digest) and retries failed batches with exponential backoff, so the
+submit routes never wait on mail delivery. smtplib and the email package
+are only imported once an SMTPSender connects or builds a mail.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional
+
+
+class ConsoleSender:
+    """Prints every notification, the default when no SMTP server is configured"""
+
+    def send_batch(self, batch: List[Dict[str, Any]]) -> None:
+        for feedback in batch:
+            print("====new feedback=====")
+            print(f" ID: {feedback['id']}")
+            print(f" FROM: {feedback['name']} ({feedback['email']})")
+            print(f" TYPE: {feedback['feedback_type']}")
+            print(f" SUBJECT: {feedback['subject']}")
+            print(f" PRIORITY: {feedback['priority']}")
+            print(f" MESSAGE: {feedback['message'][:100]}...")
+            print(f" TIMESTAMP: {feedback['timestamp']}")
+
+    def close(self) -> None:
+        pass
+
+
+class SMTPSender:
+    """Sends one digest mail per batch over a connection that is kept open between batches"""
+
+    def __init__(self, host: str, port: int = 587, username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = True, from_addr: str = 'noreply@felix.com', to_addr: str = 'admin@felix.com',
+                 timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.from_addr = from_addr
+        self.to_addr = to_addr
+        self.timeout = timeout
+        self._server: Optional['smtplib.SMTP'] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> 'smtplib.SMTP':
+        import smtplib
+        if self._server is not None:
+            try:
+                self._server.noop()
+                return self._server
+            except smtplib.SMTPException:
+                self.close()
+
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, self.password or '')
+        self._server = server
+        return server
+
+    def build_message(self, batch: List[Dict[str, Any]]) -> 'MIMEText':
+        from email.mime.text import MIMEText
+        if len(batch) == 1:
+            subject = f"New Feedback: {batch[0]['subject']}"
+        else:
+            subject = f"{len(batch)} new feedback entries"
+
+        parts = []
+        for feedback in batch:
+            parts.append(
+                f"#{feedback['id']} {feedback['subject']}\n"
+                f"From: {feedback['name']}\n"
+                f"Email: {feedback['email']}\n"
+                f"Type: {feedback['feedback_type']}\n"
+                f"Priority: {feedback['priority']}\n"
+                f"Timestamp: {feedback['timestamp']}\n\n"
+                f"Message: {feedback['message']}\n"
+            )
+
+        msg = MIMEText(('\n' + '-' * 40 + '\n\n').join(parts), 'plain', 'utf-8')
+        msg['From'] = self.from_addr
+        msg['To'] = self.to_addr
+        msg['Subject'] = subject
+        return msg
+
+    def send_batch(self, batch: List[Dict[str, Any]]) -> None:
+        import smtplib
+        msg = self.build_message(batch)
+        with self._lock:
+            try:
+                self._connection().send_message(msg)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                #a pooled connection can go stale, drop it so the retry reconnects
+                self.close()
+                raise
+
+    def close(self) -> None:
+        if self._server is not None:
+            import smtplib
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+class NotificationDispatcher:
+    """Bounded queue plus worker thread in front of a sender"""
+
+    def __init__(self, sender=None, max_queue: int = 1000, batch_size: int = 20, batch_interval: float = 2.0,
+                 max_retries: int = 3, backoff: float = 1.0):
+        self.sender = sender or ConsoleSender()
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.dropped = 0
+        self.failed = 0
+        self._queue: 'queue.Queue[Optional[Dict[str, Any]]]' = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def submit(self, feedback_entry) -> bool:
+        """Queue a notification without blocking, False if the queue is full"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(feedback_entry.to_dict())
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"Notification queue full, dropped feedback {feedback_entry.id}")
+            return False
+
+    def _ensure_worker(self) -> None:
+        # threads do not survive fork(), every worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._worker = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._worker.start()
+                self._pid = os.getpid()
+                atexit.register(self.close)
+
+    def _next_batch(self) -> Optional[List[Dict[str, Any]]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) #finish this batch, stop after it
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._deliver(batch)
+        self.sender.close()
+
+    def _deliver(self, batch: List[Dict[str, Any]]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sender.send_batch(batch)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    print(f"Error sending notification for {len(batch)} feedback entries: {e}")
+                    return False
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Deliver what is queued and stop the worker, the next submit() starts a new one"""
+        atexit.unregister(self.close)
+        if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._worker.join(timeout)
+        self._pid = None
+
+
+def create_sender(environ: Mapping[str, str]):
+    """SMTPSender when SMTP_HOST is set, otherwise ConsoleSender"""
+    host = environ.get('SMTP_HOST')
+    if not host:
+        return ConsoleSender()
+    return SMTPSender(
+        host,
+        int(environ.get('SMTP_PORT', 587)),
+        username=environ.get('SMTP_USER'),
+        password=environ.get('SMTP_PASSWORD'),
+        starttls=environ.get('SMTP_STARTTLS', '1') == '1',
+        from_addr=environ.get('NOTIFY_FROM', 'noreply@felix.com'),
+        to_addr=environ.get('NOTIFY_TO', 'admin@felix.com')
+    )
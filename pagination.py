@@ -0,0 +1,79 @@
+"""Query-string parsing for paged and projected API responses.
+
+    GET /api/feedback?limit=50&cursor=120&order=desc&fields=id,subject,status
+    GET /api/history?since=2025-01-31 12:00:00
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+DEFAULT_MAX_LIMIT = 1000
+
+
+def parse_page_args(args, max_limit: int = DEFAULT_MAX_LIMIT) -> Dict[str, Any]:
+    """Read limit/cursor/order/since from request args, raises ValueError on bad input"""
+    page = {'limit': None, 'cursor': None, 'descending': False, 'since': None}
+
+    limit = args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError("limit must be a positive integer")
+        page['limit'] = min(int(limit), max_limit)
+
+    cursor = args.get('cursor')
+    if cursor is not None:
+        if not cursor.isdigit():
+            raise ValueError("cursor must be an entry id")
+        page['cursor'] = int(cursor)
+
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    page['descending'] = order == 'desc'
+
+    since = args.get('since')
+    if since is not None:
+        try:
+            page['since'] = parse_timestamp(since)
+        except ValueError:
+            raise ValueError("since must be a timestamp like 2025-01-31 12:00:00")
+
+    return page
+
+
+def parse_limit(args, default: int, max_limit: int = DEFAULT_MAX_LIMIT) -> int:
+    """limit= of an endpoint without cursors (e.g. search), raises ValueError outside 1..max_limit"""
+    limit = args.get('limit')
+    if limit is None:
+        return default
+    if not limit.isdigit() or not 1 <= int(limit) <= max_limit:
+        raise ValueError(f"limit must be an integer from 1 to {max_limit}")
+    return int(limit)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ISO timestamp as naive local time like the stored ones, with an offset (2025-01-31T12:00:00Z) converted"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        try:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        except OverflowError:
+            raise ValueError(f"{value} is out of range")
+    return parsed
+
+
+def parse_fields(args, allowed) -> Optional[List[str]]:
+    """Read the fields= projection, None means every field"""
+    fields = args.get('fields')
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def project(data: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return data
+    return {field: data[field] for field in fields}
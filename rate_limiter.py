@@ -0,0 +1,125 @@
+"""Token bucket rate limiting with in-memory and shared SQLite backends.
+
+Each key owns a bucket of `max_requests` tokens that refills evenly over
+`window_seconds`. A check costs O(1) and stores two floats per key; a key
+whose bucket has refilled completely carries no information and is
+evicted.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# (tokens, updated_at)
+Bucket = Tuple[float, float]
+
+
+def take_token(bucket: Optional[Bucket], max_requests: int, window_seconds: int, now: float) -> Tuple[Bucket, bool, int]:
+    """Refill a bucket and try to take one token.
+
+    Returns the new bucket, whether the request is allowed and either the
+    requests left (allowed) or the seconds to wait (refused).
+    """
+    rate = max_requests / window_seconds
+    if bucket is None:
+        tokens = float(max_requests)
+    else:
+        tokens = min(float(max_requests), bucket[0] + (now - bucket[1]) * rate)
+
+    if tokens < 1:
+        return (tokens, now), False, math.ceil((1 - tokens) / rate)
+    tokens -= 1
+    return (tokens, now), True, int(tokens)
+
+
+class MemoryRateLimitBackend:
+    """Buckets in a dict kept in least-recently-used order, for a single process"""
+
+    def __init__(self):
+        self._buckets: 'OrderedDict[str, Bucket]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def hit(self, key: str, max_requests: int, window_seconds: int, now: float) -> Tuple[bool, int]:
+        with self._lock:
+            bucket, allowed, value = take_token(self._buckets.get(key), max_requests, window_seconds, now)
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            self._evict(window_seconds, now)
+        return allowed, value
+
+    def _evict(self, window_seconds: int, now: float) -> None:
+        #untouched for a whole window means the bucket is full again, oldest keys come first
+        while self._buckets:
+            key, (tokens, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < window_seconds:
+                break
+            del self._buckets[key]
+
+
+class SQLiteRateLimitBackend:
+    """Buckets in an SQLite table so the limit holds across worker processes"""
+
+    # Idle buckets are deleted at most this often
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._next_sweep = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key: str, max_requests: int, window_seconds: int, now: float) -> Tuple[bool, int]:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            bucket, allowed, value = take_token(row, max_requests, window_seconds, now)
+            conn.execute(
+                'INSERT INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, bucket[0], bucket[1])
+            )
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.SWEEP_INTERVAL
+                conn.execute('DELETE FROM rate_limits WHERE updated_at <= ?', (now - window_seconds,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, value
+
+
+class RateLimiter:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryRateLimitBackend()
+
+    def check(self, key: str, max_requests: int = 5, window_seconds: int = 3600) -> Tuple[bool, int]:
+        """(True, requests left) or (False, seconds to wait)"""
+        return self.backend.hit(key, max_requests, window_seconds, time.time())
+
+
+def create_rate_limiter(url: str) -> RateLimiter:
+    """Build a limiter from a URL such as 'memory://' or 'sqlite:///data/ratelimit.db'"""
+    if url in ('memory', 'memory://'):
+        return RateLimiter(MemoryRateLimitBackend())
+    if url.startswith('sqlite:///'):
+        return RateLimiter(SQLiteRateLimitBackend(url[len('sqlite:///'):]))
+    raise ValueError(f"Unsupported rate limit storage url: {url}")
@@ -0,0 +1,68 @@
+"""In-process cache of rendered responses.
+
+Entries are keyed by (endpoint, the query args the view reads, collection
+versions), so a change to any collection a page reads from produces a
+new key and the old body simply ages out of the LRU. The cache holds at
+most `max_entries` bodies and `max_bytes` in total, and does not keep a
+body larger than `max_entry_bytes` (a whole unpaged collection, say).
+
+ETags are a hash of the body, so every worker gives the same tag for the
+same content and a 304 works whichever worker answers.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag of a response body"""
+    return hashlib.sha1(body).hexdigest()
+
+
+class ResponseCache:
+    """Least-recently-used map of cache key -> rendered body, shared by all threads"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 max_entry_bytes: int = 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0 #bytes held
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> bool:
+        """Keep `value`, which takes `size` bytes, False when it is too large to keep"""
+        if size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
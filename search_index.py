@@ -0,0 +1,129 @@
+"""Inverted full-text index over feedback entries.
+
+Registered as an index on the feedback collection, it maps every token of
+the searchable fields to a posting list {feedback id: weight} and keeps a
+sorted vocabulary for prefix lookups. A query only touches the postings
+of its own tokens instead of scanning every entry.
+"""
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+# field -> weight of one occurrence, a hit in the subject counts three times
+SEARCH_FIELDS = {
+    'subject': 3.0,
+    'name': 2.0,
+    'message': 1.0,
+    'email': 1.0,
+    'feedback_type': 1.0,
+    'admin_notes': 1.0,
+}
+
+# query tokens shorter than this only match whole words
+MIN_PREFIX_LENGTH = 2
+
+_token_re = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    return _token_re.findall(text.lower()) if text else []
+
+
+class FeedbackSearchIndex:
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._vocabulary: List[str] = [] #sorted, for prefix matching
+        self._doc_terms: Dict[int, Dict[str, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def update(self, entry) -> None:
+        terms = defaultdict(float)
+        for field, weight in SEARCH_FIELDS.items():
+            for token in tokenize(getattr(entry, field, None)):
+                terms[token] += weight
+
+        old_terms = self._doc_terms.get(entry.id)
+        if old_terms == terms:
+            return #e.g. only the status changed
+        if old_terms:
+            self._unindex(entry.id, old_terms)
+
+        for token, weight in terms.items():
+            if token not in self._postings:
+                insort(self._vocabulary, token)
+            self._postings[token][entry.id] = weight
+        self._doc_terms[entry.id] = dict(terms)
+
+    def remove(self, entry) -> None:
+        old_terms = self._doc_terms.pop(entry.id, None)
+        if old_terms:
+            self._unindex(entry.id, old_terms)
+
+    def _unindex(self, entry_id: int, terms: Dict[str, float]) -> None:
+        for token in terms:
+            posting = self._postings[token]
+            posting.pop(entry_id, None)
+            if not posting:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def _expand(self, token: str) -> List[str]:
+        """Vocabulary terms matching a query token, the token itself first"""
+        if len(token) < MIN_PREFIX_LENGTH:
+            return [token] if token in self._postings else []
+        terms = []
+        i = bisect_left(self._vocabulary, token)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(token):
+            terms.append(self._vocabulary[i])
+            i += 1
+        return terms
+
+    def search(self, query: str, candidates: Optional[Set[int]] = None,
+               limit: Optional[int] = None) -> Tuple[List[Tuple[int, float]], int]:
+        """Ids of entries containing every query token (as a word prefix), best match first,
+        and the number of entries that matched.
+
+        `candidates` restricts the result, e.g. to the ids matching the
+        admin filters. With a `limit` only the best `limit` matches are
+        ranked and returned.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return [], 0
+
+        total = len(self._doc_terms)
+        weighted = [] #(posting, idf * boost) of every vocabulary term a query token matched
+        matches = []
+        for token in tokens:
+            terms = self._expand(token)
+            if not terms:
+                return [], 0
+            postings = [self._postings[term] for term in terms]
+            for term, posting in zip(terms, postings):
+                boost = 1.0 if term == token else 0.5 #whole words beat prefixes
+                weighted.append((posting, math.log(1 + total / len(posting)) * boost))
+            matches.append(set().union(*postings))
+
+        #every token has to match, intersect starting with the rarest, then score only the survivors
+        matches.sort(key=len)
+        ids = matches[0]
+        if candidates is not None:
+            ids &= candidates
+        for matched in matches[1:]:
+            ids &= matched
+            if not ids:
+                return [], 0
+
+        ranked = [
+            (entry_id, sum(posting[entry_id] * factor for posting, factor in weighted if entry_id in posting))
+            for entry_id in ids
+        ]
+        if limit is not None and limit < len(ranked):
+            return heapq.nlargest(limit, ranked, key=lambda item: (item[1], item[0])), len(ids)
+        ranked.sort(key=lambda item: (-item[1], -item[0]))
+        return ranked, len(ids)
@@ -0,0 +1,103 @@
+"""JSON for the API: a pluggable encoder and a cache of encoded entries.
+
+The list endpoints used to build a dict for every entry, format its
+timestamp and pass the whole list to jsonify on every request. Now each
+entry is encoded once and kept as bytes until it changes, and a page is
+just the cached pieces joined into the response:
+
+    {"status":"success","count":2,...,"feedback":[<entry 3>,<entry 4>]}
+
+JSON_ENCODER picks the encoder: orjson when it is installed (auto, the
+default) or the json module.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List
+
+Encoder = Callable[[Any], bytes]
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def create_encoder(name: str = 'auto') -> Encoder:
+    """Compact UTF-8 JSON encoder, name is 'auto', 'orjson' or 'json'"""
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+            return orjson.dumps
+        except ImportError:
+            if name == 'orjson':
+                raise ValueError("JSON_ENCODER=orjson needs orjson, pip install orjson")
+    elif name != 'json':
+        raise ValueError(f"Unknown JSON_ENCODER {name!r}, use auto, orjson or json")
+    return _json_dumps
+
+
+def splice(encode: Encoder, envelope: Dict[str, Any], key: str, fragments: Iterable[bytes]) -> bytes:
+    """encode(dict(envelope, key=[...])) where the list items are already encoded"""
+    head = encode(envelope)[:-1] + b',' if envelope else b'{'
+    return b''.join((head, encode(key), b':[', b','.join(fragments), b']}'))
+
+
+def extend_object(encode: Encoder, fragment: bytes, extra: Dict[str, Any]) -> bytes:
+    """An encoded object with the keys of `extra` added at the end"""
+    if fragment == b'{}':
+        return encode(extra)
+    return fragment[:-1] + b',' + encode(extra)[1:]
+
+
+class EncodedRecords:
+    """Collection index keeping encode(item.to_dict()) per record until the record is saved or removed.
+
+    Holds at most `max_entries` records, least recently served go first;
+    0 turns the cache off.
+    """
+
+    def __init__(self, encode: Encoder, max_entries: int = 20000):
+        self.encode = encode
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._fragments: 'OrderedDict[int, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+        #bumped on every change, pieces encoded while it moved may show the old values and are not kept
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def update(self, item) -> None:
+        with self._lock:
+            self._generation += 1
+            self._fragments.pop(item.id, None)
+
+    def remove(self, item) -> None:
+        self.update(item)
+
+    def encode_all(self, items: Iterable) -> List[bytes]:
+        """Encoded to_dict() of each item, in order"""
+        items = list(items)
+        with self._lock:
+            generation = self._generation
+            fragments = [self._fragments.get(item.id) for item in items]
+            missing = []
+            for i, fragment in enumerate(fragments):
+                if fragment is None:
+                    missing.append(i)
+                else:
+                    self._fragments.move_to_end(items[i].id)
+            self.hits += len(items) - len(missing)
+            self.misses += len(missing)
+        for i in missing:
+            fragments[i] = self.encode(items[i].to_dict())
+        if missing and self.max_entries:
+            with self._lock:
+                if self._generation == generation:
+                    for i in missing:
+                        self._fragments[items[i].id] = fragments[i]
+                    while len(self._fragments) > self.max_entries:
+                        self._fragments.popitem(last=False)
+        return fragments
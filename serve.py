@@ -0,0 +1,112 @@
+"""Production entry point: gunicorn running main.create_app() in threaded workers, or asgi.py in uvicorn workers.
+
+    pip install gunicorn                   # wsgi mode
+    pip install gunicorn uvicorn a2wsgi    # asgi mode
+
+    export SECRET_KEY=$(python -c 'import secrets; print(secrets.token_hex())')
+    GUESTBOOK_STORAGE=sqlite:///guestbook.db python serve.py
+    GUESTBOOK_STORAGE=sqlite:///guestbook.db python serve.py --mode asgi --workers 4
+    python serve.py --workers 1 --threads 16   # memory storage works with a single worker only
+
+See "Serving" in README.md for choosing workers and threads.
+"""
+import argparse
+import os
+import sys
+
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY when set (the convention of most hosts), else one per CPU plus one"""
+    return int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) + 1))
+
+
+def gunicorn_options(args) -> dict:
+    """Settings shared by both modes: gunicorn manages the worker processes either way"""
+    return {
+        'bind': f'{args.host}:{args.port}',
+        'workers': args.workers,
+        'timeout': 60,
+        'graceful_timeout': 30,
+        'keepalive': 5,
+        #recycle workers now and then, spread out so they do not all restart at once
+        'max_requests': 10000,
+        'max_requests_jitter': 1000,
+        'accesslog': '-' if args.access_log else None,
+    }
+
+
+def wsgi_options(args) -> dict:
+    """Threaded workers, so an open /api/stream client holds a thread, not a process"""
+    return dict(gunicorn_options(args), worker_class='gthread', threads=args.threads)
+
+
+def asgi_options(args) -> dict:
+    """uvicorn event loops inside gunicorn workers.
+
+    uvicorn's own --workers supervisor was measured at ~40 ms per response
+    on Linux even for a trivial app, while the same app in gunicorn's
+    uvicorn worker answers in a few milliseconds.
+    """
+    try:
+        import uvicorn_worker #pip install uvicorn-worker, the worker's home since uvicorn 0.30
+        worker_class = 'uvicorn_worker.UvicornWorker'
+    except ImportError:
+        worker_class = 'uvicorn.workers.UvicornWorker'
+    os.environ['THREADS'] = str(args.threads) #read by asgi.py in every worker
+    #client addresses come from ProxyFix (TRUSTED_PROXIES) as in wsgi mode, not from uvicorn
+    return dict(gunicorn_options(args), worker_class=worker_class, forwarded_allow_ips='')
+
+
+def run(options: dict, load) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load()
+
+    Server().run()
+
+
+def load_wsgi():
+    #built in every worker after the fork, each opens its own storage connection
+    import main
+    return main.create_app()
+
+
+def load_asgi():
+    import asgi
+    return asgi.application
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=default_workers(), help='processes')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', 8)),
+                        help='threads per worker running Flask')
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args()
+
+    if not os.environ.get('SECRET_KEY'):
+        parser.error('SECRET_KEY is not set, sessions and flash messages would be signed with the '
+                     'development default; set it to a long random string')
+    storage = os.environ.get('GUESTBOOK_STORAGE', 'memory://')
+    if args.workers > 1 and not storage.startswith('sqlite:///'):
+        parser.error(f'GUESTBOOK_STORAGE is {storage}, every worker would keep its own data; '
+                     f'use sqlite:///guestbook.db or --workers 1')
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.mode == 'asgi':
+        run(asgi_options(args), load_asgi)
+    else:
+        run(wsgi_options(args), load_wsgi)
+
+
+if __name__ == '__main__':
+    main_cli()
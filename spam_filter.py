@@ -0,0 +1,113 @@
+"""Spam rules compiled into a single regex.
+
+All rules are joined into one alternation, so a clean message is scanned
+once. Only a message that matches is then tried rule by rule, to report
+the first matching rule in rule order. Rules can be overridden by a JSON
+file which is reloaded when it changes:
+
+    {"rules": [{"name": "url", "pattern": "http[s]?://"}, ...]}
+"""
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES = [
+    ('url', r'http[s]?://'), #URL , i.e. links, posts etc.
+    ('long_number', r'[0-9]{10,}'), #Long number sequences such as phone numbers, addresses etc.
+    ('money', r'[$\£][0-9]+'), #money
+    ('ads', r'buy now|click here|limited time|offer|discount'), #ads or sales
+    ('drugs', r'viagra|cialis|weed|meth|drugs'), #Obvious
+    ('symbols', r'[!@#$%^&*()]{5,}'), #wierd amount of symbols for a feedback
+]
+
+
+class SpamFilter:
+    """Case-insensitive spam matcher with optional hot-reloaded rules file"""
+
+    def __init__(self, rules_file: Optional[str] = None, reload_interval: float = 5.0):
+        self.rules_file = rules_file
+        self.reload_interval = reload_interval
+        self.version = 0
+        #why the rules file was last rejected, None once it loads
+        self.error: Optional[str] = None
+        self._file_mtime: Optional[float] = None
+        self._next_reload_check = 0.0
+        self.set_rules(DEFAULT_RULES)
+        if rules_file:
+            self.reload()
+
+    def set_rules(self, rules: Iterable[Tuple[str, str]]) -> None:
+        rules = list(rules)
+        compiled: List[Tuple[str, Pattern]] = []
+        for name, pattern in rules:
+            if not isinstance(name, str) or not name.isidentifier():
+                raise ValueError(f"Invalid spam rule name: {name!r}")
+            try:
+                compiled.append((name, re.compile(pattern, re.IGNORECASE)))
+            except re.error as e: #report the broken rule, not the combined pattern
+                raise ValueError(f"Invalid pattern in spam rule {name}: {e}")
+        try:
+            combined = re.compile('|'.join(f'(?:{pattern})' for name, pattern in rules),
+                                  re.IGNORECASE) if rules else None
+        except re.error:
+            #e.g. two rules defining the same named group, those only work one by one
+            combined = None
+        self.rules = rules
+        self._compiled = compiled
+        self._pattern = combined
+        self.version += 1
+
+    def reload(self) -> bool:
+        """Load the rules file if it changed since the last load, returns True when rules were replaced"""
+        try:
+            mtime = os.path.getmtime(self.rules_file)
+            if mtime == self._file_mtime:
+                return False
+            self._file_mtime = mtime #a rejected version is reported once, not on every check
+            with open(self.rules_file, encoding='utf-8') as f:
+                data = json.load(f)
+            self.set_rules((rule['name'], rule['pattern']) for rule in data['rules'])
+            self.error = None
+            return True
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            #keep the rules we have, a half-edited file should not disable the filter
+            self.error = f"{type(e).__name__}: {e}"
+            logger.error("Spam rules file %s rejected, still using the previous %d rules (version %d): %s",
+                         self.rules_file, len(self.rules), self.version, self.error)
+            return False
+
+    def _maybe_reload(self) -> None:
+        if self.rules_file and time.monotonic() >= self._next_reload_check:
+            self._next_reload_check = time.monotonic() + self.reload_interval
+            self.reload()
+
+    def _first_rule(self, text: str) -> Optional[str]:
+        if self._pattern is not None and not self._pattern.search(text):
+            return None
+        for name, pattern in self._compiled:
+            if pattern.search(text):
+                return name
+        return None
+
+    def check(self, text: str) -> Optional[str]:
+        """Name of the first rule (in rule order) matching the text, None if it looks clean"""
+        self._maybe_reload()
+        return self._first_rule(text)
+
+    def scan(self, items: Iterable[Tuple[int, str]]) -> Dict[int, str]:
+        """Check many (id, text) pairs at once, returns {id: rule} for the ones that match"""
+        self._maybe_reload()
+        if not self._compiled:
+            return {}
+        first_rule = self._first_rule
+        flagged = {}
+        for item_id, text in items:
+            rule = first_rule(text)
+            if rule is not None:
+                flagged[item_id] = rule
+        return flagged
@@ -56,7 +56,17 @@ async function fetchGuestbookEntries() {
     }
 }
 
+// Live updates instead of re-fetching the list, EventSource reconnects and resumes by itself
+function subscribeToUpdates(onEvent) {
+    const source = new EventSource('/api/stream');
+    ['guestbook_created', 'guestbook_deleted', 'feedback_created', 'feedback_updated', 'reset', 'lost']
+        .forEach(type => {
+            source.addEventListener(type, event => onEvent(type, JSON.parse(event.data)));
+        });
+    return source;
+}
+
 // Export for potential module usage
 if (typeof module !== 'undefined' && module.exports) {
-    module.exports = { fetchGuestbookEntries };
+    module.exports = { fetchGuestbookEntries, subscribeToUpdates };
 }
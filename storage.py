@@ -0,0 +1,931 @@
+"""Pluggable storage for guestbook, feedback and history records.
+
+Reads are always served from memory. Every mutation is also appended to an
+operation log owned by a backend, and the log is replayed on startup and
+tailed before each request so several worker processes share one dataset.
+The SQLite backend keeps the log in a WAL-mode database. The app commits
+the rows of a request before it responds, so other workers see the write
+as soon as the client does, and a WAL commit does not wait on an fsync.
+
+In-place changes log only the fields they set ('update' operations), so
+two workers editing different fields of one record concurrently both
+keep their change.
+
+Every change is written to the log before memory and indexes see it, so
+a change that fails to log (e.g. a value JSON cannot hold) leaves no
+trace. An index that raises is logged and skipped, the others stay
+current.
+
+Concurrency: every mutation, replay and id allocation of a store runs
+under the store's re-entrant `lock`, so indexes always see one change at
+a time. Readers that scan a whole collection iterate an immutable
+snapshot that is rebuilt at most once per change (copy-on-write), while
+point reads and paging take the lock only briefly. Across processes ids
+come from the backend, so two workers never hand out the same id.
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# (seq, origin, collection, op, record_id, payload)
+LogRecord = Tuple[int, str, str, str, Optional[int], Optional[str]]
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot store value of type {type(value).__name__}")
+
+
+def _decode_hook(data: Dict[str, Any]) -> Any:
+    if len(data) == 1 and '__datetime__' in data:
+        return datetime.fromisoformat(data['__datetime__'])
+    return data
+
+
+def intern_str(value: Any) -> Any:
+    """One shared copy per distinct string, for values repeated across many records"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    """Base of the slotted entry classes.
+
+    Subclasses list their attributes in __slots__, so a record carries no
+    per-instance dict. The timestamp is kept as whole epoch seconds in
+    `_ts` and exposed as a local datetime, and the fields named in
+    INTERNED (user agents, IPs, ...) are interned on load.
+    """
+
+    __slots__ = ()
+    INTERNED: Tuple[str, ...] = ()
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self._ts)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime) -> None:
+        self._ts = int(value.timestamp())
+
+
+_slot_cache: Dict[type, Tuple[str, ...]] = {}
+
+
+def record_slots(record_cls: type) -> Tuple[str, ...]:
+    slots = _slot_cache.get(record_cls)
+    if slots is None:
+        slots = _slot_cache[record_cls] = tuple(
+            name for cls in reversed(record_cls.__mro__) for name in cls.__dict__.get('__slots__', ())
+        )
+    return slots
+
+
+def record_state(obj: Any) -> Dict[str, Any]:
+    """Attributes of an entry object, slotted or not"""
+    if hasattr(obj, '__dict__'):
+        return vars(obj)
+    return {name: getattr(obj, name) for name in record_slots(type(obj)) if hasattr(obj, name)}
+
+
+def build_record(record_cls: type, state: Dict[str, Any]) -> Any:
+    """Create an entry object from its attributes without running its (request bound) __init__"""
+    obj = record_cls.__new__(record_cls)
+    for name, value in state.items():
+        try:
+            setattr(obj, name, value)
+        except AttributeError:
+            pass #a field that no longer exists
+    for name in getattr(record_cls, 'INTERNED', ()):
+        if hasattr(obj, name):
+            setattr(obj, name, intern_str(getattr(obj, name)))
+    return obj
+
+
+def copy_record(obj: Any, **changes: Any) -> Any:
+    """A new entry object like `obj` with `changes` applied, to save() without touching the one readers see"""
+    state = dict(record_state(obj))
+    state.update(changes)
+    return build_record(type(obj), state)
+
+
+def encode_record(obj: Any, fields: Optional[Tuple[str, ...]] = None) -> str:
+    """Serialize an entry object's attributes, or only the named `fields`, to JSON"""
+    state = record_state(obj) if fields is None else {name: getattr(obj, name) for name in fields}
+    return json.dumps(state, default=_encode_default, ensure_ascii=False)
+
+
+def decode_record(record_cls: type, payload: str) -> Any:
+    """Rebuild an entry object, old logs with datetime timestamps included"""
+    return build_record(record_cls, json.loads(payload, object_hook=_decode_hook))
+
+
+class StorageBackend:
+    """Append-only operation log shared by all collections"""
+
+    origin = 'local'
+
+    def append(self, collection: str, op: str, record_id: Optional[int], payload: Optional[str]) -> None:
+        raise NotImplementedError
+
+    def append_many(self, collection: str, op: str, records: List[Tuple[int, Optional[str]]]) -> None:
+        """Append (record id, payload) pairs, durable as one unit when the backend has transactions"""
+        for record_id, payload in records:
+            self.append(collection, op, record_id, payload)
+
+    def read_since(self, seq: int) -> Iterator[LogRecord]:
+        raise NotImplementedError
+
+    def trim(self, collection: str, keep: int, count_by: Optional[str] = None) -> None:
+        """Drop all but the newest `keep` log rows of a capped collection.
+
+        With `count_by` the dropped rows are first added to the saved
+        per-value counts of that field, see load_counts().
+        """
+
+    def load_counts(self, collection: str) -> Dict[str, int]:
+        """Counts folded in by trim(), for records no longer in the log"""
+        return {}
+
+    def trimmed_since(self, seq: int) -> Dict[str, int]:
+        """{collection: last trimmed seq} of the collections trim() deleted rows after `seq` from"""
+        return {}
+
+    def load_capped(self, collection: str) -> Tuple[Dict[str, int], List[Tuple[int, str]]]:
+        """load_counts() and the (seq, payload) rows still in the log, read consistently"""
+        return self.load_counts(collection), []
+
+    def allocate_id(self, collection: str, at_least: int, count: int = 1) -> Optional[int]:
+        """Reserve the next `count` record ids shared by all processes and return the last one,
+        None when ids are per process"""
+        return None
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class MemoryStorage(StorageBackend):
+    """No persistence at all - data lives as long as the process does"""
+
+    def append(self, collection, op, record_id, payload):
+        pass
+
+    def read_since(self, seq):
+        return iter(())
+
+
+class SQLiteStorage(StorageBackend):
+    """Operation log in an SQLite database running in WAL mode.
+
+    Appends are buffered until flush(), which the app calls before every
+    response, so a request's rows go out in one transaction. Writers
+    outside a request (scripts, imports) are flushed once `batch_size`
+    rows are pending or every `flush_interval` seconds. With
+    synchronous=NORMAL a WAL commit does not fsync.
+    """
+
+    def __init__(self, path: str, batch_size: int = 50, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._pending: List[Tuple[str, str, str, Optional[int], Optional[str]]] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._stop = threading.Event()
+        atexit.register(self.close)
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections and threads do not survive fork(), so a pre-forking
+        # server gets a fresh connection, origin and flusher per worker
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.origin = uuid.uuid4().hex
+            self._pending = []
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS oplog ('
+                ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' origin TEXT NOT NULL,'
+                ' collection TEXT NOT NULL,'
+                ' op TEXT NOT NULL,'
+                ' record_id INTEGER,'
+                ' payload TEXT)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS oplog_collection ON oplog (collection, seq)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS counts ('
+                ' collection TEXT NOT NULL,'
+                ' value TEXT NOT NULL,'
+                ' count INTEGER NOT NULL,'
+                ' PRIMARY KEY (collection, value))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS ids (collection TEXT PRIMARY KEY, last_id INTEGER NOT NULL)'
+            )
+            #the last seq trim() deleted per collection, workers that had not read that far reload
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS trims (collection TEXT PRIMARY KEY, seq INTEGER NOT NULL)'
+            )
+            threading.Thread(target=self._run_flusher, name='storage-flusher', daemon=True).start()
+        return self._conn
+
+    def _run_flusher(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                logger.exception("Error flushing storage")
+
+    def append(self, collection, op, record_id, payload):
+        with self._lock:
+            self._connection()
+            self._pending.append((self.origin, collection, op, record_id, payload))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def append_many(self, collection, op, records):
+        with self._lock:
+            self._connection()
+            self._pending.extend((self.origin, collection, op, record_id, payload) for record_id, payload in records)
+            self.flush()
+
+    def read_since(self, seq):
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT seq, origin, collection, op, record_id, payload FROM oplog WHERE seq > ? ORDER BY seq',
+                (seq,)
+            ).fetchall()
+        return iter(rows)
+
+    def trim(self, collection, keep, count_by=None):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute(
+                    'SELECT seq FROM oplog WHERE collection = ? ORDER BY seq DESC LIMIT 1 OFFSET ?',
+                    (collection, keep)
+                ).fetchone()
+                if row is None:
+                    return
+                if count_by is not None:
+                    conn.execute(
+                        'INSERT INTO counts (collection, value, count) '
+                        'SELECT collection, json_extract(payload, ?), COUNT(*) FROM oplog '
+                        'WHERE collection = ? AND seq <= ? GROUP BY 1, 2 '
+                        'ON CONFLICT (collection, value) DO UPDATE SET count = count + excluded.count',
+                        ('$.' + count_by, collection, row[0])
+                    )
+                conn.execute('DELETE FROM oplog WHERE collection = ? AND seq <= ?', (collection, row[0]))
+                conn.execute(
+                    'INSERT INTO trims (collection, seq) VALUES (?, ?) '
+                    'ON CONFLICT (collection) DO UPDATE SET seq = excluded.seq',
+                    (collection, row[0])
+                )
+
+    def load_counts(self, collection):
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT value, count FROM counts WHERE collection = ?', (collection,)
+            ).fetchall()
+        return dict(rows)
+
+    def trimmed_since(self, seq):
+        with self._lock:
+            rows = self._connection().execute('SELECT collection, seq FROM trims WHERE seq > ?', (seq,)).fetchall()
+        return dict(rows)
+
+    def load_capped(self, collection):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN') #one snapshot, a trim cannot slip in between the two reads
+                counts = conn.execute(
+                    'SELECT value, count FROM counts WHERE collection = ?', (collection,)
+                ).fetchall()
+                rows = conn.execute(
+                    'SELECT seq, payload FROM oplog WHERE collection = ? ORDER BY seq', (collection,)
+                ).fetchall()
+        return dict(counts), rows
+
+    def allocate_id(self, collection, at_least, count=1):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute(
+                    'INSERT INTO ids (collection, last_id) VALUES (?, ?) '
+                    'ON CONFLICT (collection) DO UPDATE SET last_id = max(last_id + ?, excluded.last_id)',
+                    (collection, at_least + count - 1, count)
+                )
+                return conn.execute('SELECT last_id FROM ids WHERE collection = ?', (collection,)).fetchone()[0]
+
+    def flush(self):
+        with self._lock:
+            if not self._pending or self._pid != os.getpid():
+                return
+            conn = self._connection()
+            batch, self._pending = self._pending, []
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany(
+                    'INSERT INTO oplog (origin, collection, op, record_id, payload) VALUES (?, ?, ?, ?, ?)',
+                    batch
+                )
+
+    def close(self):
+        atexit.unregister(self.close)
+        self._stop.set()
+        self.flush()
+
+
+class Collection:
+    """Id-keyed set of records that writes every change through to the store.
+
+    Records live in an insertion-ordered dict, so get, save and delete are
+    O(1) and iteration still yields entries oldest first. Ids come from a
+    monotonic counter and are never reused after a delete. A sorted list of
+    live ids backs cursor paging.
+
+    Indexes registered with add_index() get update(item) after every insert
+    or save and remove(item) after every delete, including replayed ones,
+    always after the change is in the log.
+
+    `time_ordered` stays True while timestamps grow with ids, which lets
+    paging find `since` by bisection. Importing rows with older timestamps
+    clears it for good, and `since` then scans the requested id range.
+
+    `version` goes up with every change and `modified` is the time of the
+    last one, for cache validation.
+    """
+
+    def __init__(self, store: 'Store', name: str, record_cls: type):
+        self.store = store
+        self.name = name
+        self.record_cls = record_cls
+        self.version = 0
+        self.modified = datetime.now()
+        self._items: Dict[int, Any] = {}
+        self._order: List[int] = []
+        self._last_id = 0
+        self._indexes: List[Any] = []
+        self._snapshot: Optional[Tuple[Any, ...]] = None
+        self.time_ordered = True
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __reversed__(self):
+        return reversed(self.snapshot())
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._items
+
+    def next_id(self) -> int:
+        """Allocate the id for a new record"""
+        return self.store.allocate_id(self)
+
+    def next_ids(self, count: int) -> range:
+        """Allocate consecutive ids for `count` new records at once"""
+        if count <= 0:
+            return range(0)
+        last = self.store.allocate_id(self, count)
+        return range(last - count + 1, last + 1)
+
+    def add_index(self, index: Any) -> None:
+        with self.store.lock:
+            self._indexes.append(index)
+            for item in self._items.values():
+                index.update(item)
+
+    def attach_index(self, index: Any, snapshot: Tuple[Any, ...]) -> None:
+        """add_index() for an index already filled from `snapshot` without the lock held.
+
+        Only the records written or deleted since the snapshot are replayed,
+        so writers wait for the catch-up and not for the whole build.
+        """
+        with self.store.lock:
+            if self.snapshot() is not snapshot:
+                seen = {item.id: item for item in snapshot}
+                for item in self._items.values():
+                    if seen.pop(item.id, None) is not item:
+                        index.update(item)
+                for item in seen.values():
+                    index.remove(item)
+            self._indexes.append(index)
+
+    def snapshot(self) -> Tuple[Any, ...]:
+        """All records oldest first as a tuple that later changes leave alone"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.store.lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = tuple(self._items.values())
+        return snapshot
+
+    def get(self, record_id: int) -> Optional[Any]:
+        return self._items.get(record_id)
+
+    def first(self) -> Optional[Any]:
+        with self.store.lock:
+            return next(iter(self._items.values()), None)
+
+    def page(self, cursor: Optional[int] = None, limit: Optional[int] = None, descending: bool = False,
+             since: Optional[datetime] = None) -> Tuple[List[Any], Optional[int]]:
+        """Return one page of records and the cursor for the next one"""
+        with self.store.lock:
+            return _page(self._order, self._items.__getitem__, cursor, limit, descending, since,
+                         time_ordered=self.time_ordered)
+
+    def iter_pages(self, page_size: int = 1000):
+        """Iterate page by page, safe while other threads add or delete records"""
+        cursor = None
+        while True:
+            items, cursor = self.page(cursor=cursor, limit=page_size)
+            yield from items
+            if cursor is None:
+                return
+
+    def append(self, item: Any) -> None:
+        with self.store.lock:
+            self.store.log(self.name, 'put', item.id, item)
+            self._put(item.id, item)
+
+    def extend(self, items: List[Any]) -> None:
+        """Add many records under one hold of the lock, written to the log in one transaction"""
+        with self.store.lock:
+            self.store.log_many(self.name, 'put', items)
+            for item in items:
+                self._put(item.id, item)
+
+    def _put(self, record_id: int, item: Any) -> None:
+        if record_id not in self._items:
+            if not self._order or record_id > self._order[-1]:
+                position = len(self._order)
+                self._order.append(record_id)
+            else:
+                position = bisect_left(self._order, record_id)
+                self._order.insert(position, record_id)
+        else:
+            position = bisect_left(self._order, record_id)
+        self._items[record_id] = item
+        if self.time_ordered:
+            self._check_time_order(position)
+        self._last_id = max(self._last_id, record_id)
+        self._changed()
+        self._notify('update', item)
+
+    def _notify(self, method: str, item: Any) -> None:
+        for index in self._indexes:
+            try:
+                getattr(index, method)(item)
+            except Exception:
+                #the change is logged and in _items already, keep the other indexes current
+                logger.exception("Index %r of %s failed on record %s", index, self.name, item.id)
+
+    def _check_time_order(self, position: int) -> None:
+        """Clear time_ordered if the record at _order[position] is out of timestamp order with its neighbours"""
+        order, items = self._order, self._items
+        ts = items[order[position]]._ts
+        if ((position > 0 and items[order[position - 1]]._ts > ts)
+                or (position + 1 < len(order) and items[order[position + 1]]._ts < ts)):
+            self.time_ordered = False
+
+    def _remove(self, record_id: int) -> bool:
+        item = self._items.pop(record_id, None)
+        if item is None:
+            return False
+        del self._order[bisect_left(self._order, record_id)]
+        self._changed()
+        self._notify('remove', item)
+        return True
+
+    def _changed(self) -> None:
+        self.version += 1
+        self.modified = datetime.now()
+        self._snapshot = None
+
+    def save(self, item: Any, fields: Optional[Tuple[str, ...]] = None) -> None:
+        """Persist a changed version of a record, it replaces the stored one.
+
+        Build it with copy_record(), so readers never see half of a change
+        and a failed log write leaves the stored record as it was. With
+        `fields` only those are logged, and replaying the change keeps
+        whatever other workers wrote to the other fields meanwhile. Hold
+        store.lock around the get(), the copy and the save: a sync may
+        replace the record with another worker's version at any time.
+        """
+        with self.store.lock:
+            self.store.log(self.name, 'put' if fields is None else 'update', item.id, item, fields)
+            self._put(item.id, item)
+
+    def save_many(self, items: List[Any], fields: Optional[Tuple[str, ...]] = None) -> None:
+        """save() for many records, written to the log in one transaction"""
+        if not items:
+            return
+        with self.store.lock:
+            self.store.log_many(self.name, 'put' if fields is None else 'update', items, fields)
+            for item in items:
+                self._put(item.id, item)
+
+    def delete(self, record_id: int) -> bool:
+        with self.store.lock:
+            if record_id not in self._items:
+                return False
+            self.store.log(self.name, 'delete', record_id, None)
+            return self._remove(record_id)
+
+    def _apply(self, op: str, record_id: Optional[int], payload: Optional[str]) -> None:
+        """Apply one replayed log operation"""
+        self._last_id = max(self._last_id, record_id)
+        if op == 'delete':
+            self._remove(record_id)
+        elif op == 'update':
+            item = self._items.get(record_id)
+            if item is not None: #else deleted since
+                state = record_state(item)
+                state.update(json.loads(payload, object_hook=_decode_hook))
+                self._put(record_id, build_record(self.record_cls, state))
+        else:
+            self._put(record_id, decode_record(self.record_cls, payload))
+
+
+class RingBuffer:
+    """Fixed-size sequence that overwrites its oldest item, O(1) append and indexing"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._slots: List[Any] = [None] * size
+        self._start = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._slots[(self._start + i) % self.size]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('ring buffer index out of range')
+        return self._slots[(self._start + index) % self.size]
+
+    def append(self, item: Any) -> Optional[Any]:
+        """Add an item, returns the one it evicted (if any)"""
+        if self._len < self.size:
+            self._slots[(self._start + self._len) % self.size] = item
+            self._len += 1
+            return None
+        evicted = self._slots[self._start]
+        self._slots[self._start] = item
+        self._start = (self._start + 1) % self.size
+        return evicted
+
+
+class ColumnarRingBuffer:
+    """RingBuffer of slotted records stored column by column.
+
+    Each attribute gets its own column, integers (ids, epoch timestamps)
+    in 8-byte arrays, so a row costs a few machine words plus its unique
+    strings instead of a whole object. Records are rebuilt on access.
+    """
+
+    INT_FIELDS = ('id', '_ts')
+
+    def __init__(self, size: int, record_cls: type):
+        self.size = size
+        self.record_cls = record_cls
+        self.fields = record_slots(record_cls)
+        self._columns = {
+            name: array('q', bytes(8 * size)) if name in self.INT_FIELDS else [None] * size
+            for name in self.fields
+        }
+        self._start = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._row((self._start + i) % self.size)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('ring buffer index out of range')
+        return self._row((self._start + index) % self.size)
+
+    def _row(self, slot: int) -> Any:
+        obj = self.record_cls.__new__(self.record_cls)
+        for name, column in self._columns.items():
+            setattr(obj, name, column[slot])
+        return obj
+
+    def append(self, item: Any) -> None:
+        """Add an item, overwriting the oldest one when full"""
+        if self._len < self.size:
+            slot = (self._start + self._len) % self.size
+            self._len += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % self.size
+        for name, column in self._columns.items():
+            column[slot] = getattr(item, name)
+
+
+class CappedCollection:
+    """Append-only ring buffer of the newest `max_len` records.
+
+    With `count_by` it also keeps running totals per value of that field
+    (e.g. per history action) that include evicted records, and survive
+    restarts through the backend's saved counts. `version` and `modified`
+    work as on Collection. With `columnar` (slotted records only) the
+    records are kept in a ColumnarRingBuffer.
+
+    append() gives each record its id, so local records arrive in id order.
+    Replays from other workers can still land out of order; `id_ordered`
+    then turns False and page() sorts a copy of the ring instead of
+    bisecting it.
+    """
+
+    def __init__(self, store: 'Store', name: str, record_cls: type, max_len: int, count_by: Optional[str] = None,
+                 columnar: bool = False):
+        self.store = store
+        self.name = name
+        self.record_cls = record_cls
+        self.max_len = max_len
+        self.count_by = count_by
+        self.columnar = columnar
+        self.version = 0
+        self.modified = datetime.now()
+        self.counts = Counter()
+        self._items = self._new_buffer()
+        self._last_id = 0
+        self._snapshot: Optional[Tuple[Any, ...]] = None
+        self.time_ordered = True
+        self.id_ordered = True
+        self._last_ts: Optional[int] = None
+        self._tail_id: Optional[int] = None
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        with self.store.lock:
+            return self._items[index]
+
+    def snapshot(self) -> Tuple[Any, ...]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.store.lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = tuple(self._items)
+        return snapshot
+
+    @property
+    def total(self) -> int:
+        """Number of records ever added, evicted ones included"""
+        return sum(self.counts.values()) if self.count_by else len(self._items)
+
+    def next_id(self) -> int:
+        return self.store.allocate_id(self)
+
+    def page(self, cursor: Optional[int] = None, limit: Optional[int] = None, descending: bool = False,
+             since: Optional[datetime] = None) -> Tuple[List[Any], Optional[int]]:
+        """Return one page of records and the cursor for the next one"""
+        with self.store.lock:
+            if self.id_ordered:
+                items, time_ordered = self._items, self.time_ordered
+            else:
+                items, time_ordered = sorted(self._items, key=lambda item: item.id), False
+            return _page(items, lambda item: item, cursor, limit, descending, since, key=lambda item: item.id,
+                         time_ordered=time_ordered)
+
+    def append(self, item: Any) -> None:
+        """Give `item` the next id and add it, both under the lock so the ring stays in id order"""
+        with self.store.lock:
+            item.id = self.next_id()
+            self.store.log(self.name, 'put', None, item)
+            self._add(item)
+
+    def _add(self, item: Any) -> None:
+        self._last_id = max(self._last_id, item.id)
+        if self._tail_id is not None and item.id < self._tail_id:
+            self.id_ordered = False #another worker's record replayed after a newer one of ours
+        if self._last_ts is not None and item._ts < self._last_ts:
+            self.time_ordered = False #e.g. a replayed entry a second older than our own last one
+        self._tail_id = item.id
+        self._last_ts = item._ts
+        self._items.append(item)
+        self.version += 1
+        self.modified = datetime.now()
+        self._snapshot = None
+        if self.count_by:
+            self.counts[getattr(item, self.count_by)] += 1
+
+    def _apply(self, op: str, record_id: Optional[int], payload: Optional[str]) -> None:
+        item = decode_record(self.record_cls, payload)
+        if not hasattr(item, 'id'):  # logged before history records had ids
+            item.id = self._last_id + 1
+        self._add(item)
+
+    def _new_buffer(self):
+        return ColumnarRingBuffer(self.max_len, self.record_cls) if self.columnar else RingBuffer(self.max_len)
+
+    def _reload(self, counts: Dict[str, int], payloads: List[str]) -> None:
+        """Start over from the backend's saved counts and the log rows it still keeps"""
+        self._items = self._new_buffer()
+        self.time_ordered = True
+        self.id_ordered = True
+        self._last_ts = None
+        self._tail_id = None
+        self.counts = Counter(counts)
+        self.version += 1
+        self.modified = datetime.now()
+        self._snapshot = None
+        for payload in payloads:
+            self._apply('put', None, payload)
+
+
+def _page(order: List[Any], resolve, cursor: Optional[int], limit: Optional[int], descending: bool,
+          since: Optional[datetime], key=None, time_ordered: bool = True) -> Tuple[List[Any], Optional[int]]:
+    """Slice a list sorted by id using bisect instead of a scan.
+
+    `cursor` is the last id of the previous page and is exclusive, `since`
+    keeps only records newer than a timestamp, found by bisection while
+    timestamps grow with ids (`time_ordered`) and by a scan otherwise.
+    New records always sort after existing ones, so pages stay stable while
+    entries are being added.
+    """
+    id_key = key or (lambda value: value)
+    lo, hi = 0, len(order)
+    if since is not None and time_ordered:
+        lo = bisect_right(order, since, key=lambda value: resolve(value).timestamp)
+    if cursor is not None:
+        if descending:
+            hi = bisect_left(order, cursor, key=id_key)
+        else:
+            lo = max(lo, bisect_right(order, cursor, key=id_key))
+    hi = max(lo, hi)
+
+    if since is not None and not time_ordered:
+        return _scan_page(order, resolve, lo, hi, limit, descending, since)
+
+    if limit is None or limit >= hi - lo:
+        selected, has_more = order[lo:hi], False
+    elif descending:
+        selected, has_more = order[hi - limit:hi], True
+    else:
+        selected, has_more = order[lo:lo + limit], True
+
+    items = [resolve(value) for value in selected]
+    if descending:
+        items.reverse()
+    next_cursor = items[-1].id if has_more and items else None
+    return items, next_cursor
+
+
+def _scan_page(order: List[Any], resolve, lo: int, hi: int, limit: Optional[int], descending: bool,
+               since: datetime) -> Tuple[List[Any], Optional[int]]:
+    """_page() for records newer than `since` between positions lo and hi, checking every record"""
+    try:
+        since_ts = since.timestamp()
+    except (OverflowError, ValueError): #beyond what epoch seconds reach
+        since_ts = float('-inf') if since.year < 1970 else float('inf')
+    positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+    items = []
+    for position in positions:
+        item = resolve(order[position])
+        if item._ts > since_ts:
+            if limit is not None and len(items) == limit:
+                return items, items[-1].id
+            items.append(item)
+    return items, None
+
+
+class Store:
+    """Owns the backend and routes replayed operations to their collection"""
+
+    # Capped collections get their log trimmed every this many appends
+    TRIM_EVERY = 500
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.collections: Dict[str, Any] = {}
+        self.lock = threading.RLock()
+        self._seq = 0
+        self._appends = 0
+        self._trims_seen: Dict[str, int] = {}
+
+    def collection(self, name: str, record_cls: type) -> Collection:
+        coll = Collection(self, name, record_cls)
+        self.collections[name] = coll
+        return coll
+
+    def capped_collection(self, name: str, record_cls: type, max_len: int,
+                          count_by: Optional[str] = None, columnar: bool = False) -> CappedCollection:
+        coll = CappedCollection(self, name, record_cls, max_len, count_by, columnar)
+        if count_by:
+            coll.counts.update(self.backend.load_counts(name))
+        self.collections[name] = coll
+        return coll
+
+    def log(self, name: str, op: str, record_id: Optional[int], item: Any,
+            fields: Optional[Tuple[str, ...]] = None) -> None:
+        payload = encode_record(item, fields) if item is not None else None
+        self.backend.append(name, op, record_id, payload)
+
+        coll = self.collections[name]
+        if isinstance(coll, CappedCollection):
+            self._appends += 1
+            if self._appends % self.TRIM_EVERY == 0:
+                self.backend.trim(name, coll.max_len, coll.count_by)
+
+    def log_many(self, name: str, op: str, items: List[Any], fields: Optional[Tuple[str, ...]] = None) -> None:
+        """log() for a batch of records of a plain collection"""
+        self.backend.append_many(name, op, [(item.id, encode_record(item, fields)) for item in items])
+
+    def allocate_id(self, coll, count: int = 1) -> int:
+        """Next id (the last of `count` new ones) of a collection, unique across processes when the
+        backend shares ids"""
+        with self.lock:
+            allocated = self.backend.allocate_id(coll.name, coll._last_id + 1, count)
+            coll._last_id = max(coll._last_id + count, allocated or 0)
+            return coll._last_id
+
+    def sync(self) -> None:
+        """Pull in operations written by other processes since the last sync.
+
+        When a trim (by any worker) deleted capped collection rows this
+        store had not read yet, those rows only live on in the saved
+        counts, so the collection is rebuilt from the backend instead.
+        """
+        with self.lock:
+            reloaded: Dict[str, int] = {}
+            for name, trimmed in self.backend.trimmed_since(self._seq).items():
+                coll = self.collections.get(name)
+                if not isinstance(coll, CappedCollection) or self._trims_seen.get(name) == trimmed:
+                    continue
+                self.backend.flush() #our own pending rows belong in the rebuilt collection too
+                counts, rows = self.backend.load_capped(name)
+                coll._reload(counts, [payload for _, payload in rows])
+                self._trims_seen[name] = trimmed
+                reloaded[name] = rows[-1][0] if rows else trimmed
+            for seq, origin, name, op, record_id, payload in self.backend.read_since(self._seq):
+                self._seq = seq
+                if origin == self.backend.origin or seq <= reloaded.get(name, 0):
+                    continue
+                coll = self.collections.get(name)
+                if coll is not None:
+                    coll._apply(op, record_id, payload)
+
+    def flush(self) -> None:
+        self.backend.flush()
+
+    def close(self) -> None:
+        """Write out buffered log rows and stop the backend's background work"""
+        self.backend.close()
+
+
+def create_store(url: str) -> Store:
+    """Build a store from a URL such as 'memory://' or 'sqlite:///data/guestbook.db'"""
+    if url in ('memory', 'memory://'):
+        return Store(MemoryStorage())
+    if url.startswith('sqlite:///'):
+        return Store(SQLiteStorage(url[len('sqlite:///'):]))
+    raise ValueError(f"Unsupported storage url: {url}")